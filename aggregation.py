@@ -0,0 +1,87 @@
+# Strategies to reduce the compressed lengths of a class to one score per class.
+# An aggregation takes the score matrix of a batch - compressed lengths of shape (n_texts, n_labels, n_compressors),
+# MISSING_SCORE where a class has no compressor or was not scored - and the byte lengths of the texts, of shape
+# (n_texts,). It returns costs of shape (n_texts, n_labels): the lower the cost, the better the class.
+# Classes without any score get an infinite cost, so that they are never predicted.
+from typing import Callable, Dict
+
+import numpy as np
+
+# classes can have fewer compressors than num_compressors_per_class, eg if they have fewer texts
+MISSING_SCORE = -1
+
+# with fewer classes, sorting all the classes is faster than partitioning them
+PARTITION_MIN_CLASSES = 128
+
+Aggregation = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def sum_scores(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    valid = scores != MISSING_SCORE
+    return _unscored_to_inf(np.where(valid, scores, 0).sum(axis=-1, dtype=np.float64), valid)
+
+
+def mean_scores(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    valid = scores != MISSING_SCORE
+    with np.errstate(invalid="ignore", divide="ignore"):
+        costs = np.where(valid, scores, 0).sum(axis=-1, dtype=np.float64) / valid.sum(axis=-1)
+    return _unscored_to_inf(costs, valid)
+
+
+def min_scores(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    valid = scores != MISSING_SCORE
+    return _unscored_to_inf(np.where(valid, scores, np.iinfo(scores.dtype).max).min(axis=-1).astype(np.float64),
+                            valid)
+
+
+# the i-th compressors of all classes vote for the class that compresses the text best. Ties are broken by the sum.
+def vote_scores(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    valid = scores != MISSING_SCORE
+    masked = np.where(valid, scores, np.iinfo(scores.dtype).max)
+    # best class of each compressor index, only counted if at least one class has this compressor
+    winners = masked.argmin(axis=1)
+    voting = valid.any(axis=1)
+    votes = np.zeros(scores.shape[:2], dtype=np.float64)
+    rows, columns = np.nonzero(voting)
+    np.add.at(votes, (rows, winners[rows, columns]), 1)
+    sums = sum_scores(scores, lengths)
+    finite = np.isfinite(sums)
+    # the sum tie-breaker is scaled to [0, 1[ so that it never changes the number of votes
+    scale = np.where(finite, sums, 0).max(axis=1, keepdims=True) + 1
+    return np.where(finite, sums / scale - votes, np.inf)
+
+
+# mean compressed length per byte of the text. Gives the same ranking as the mean, but costs can be compared
+# between texts, eg to calibrate predictions
+def normalized_scores(scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    return mean_scores(scores, lengths) / np.maximum(lengths, 1)[:, np.newaxis]
+
+
+AGGREGATIONS: Dict[str, Aggregation] = {
+    "sum": sum_scores,
+    "mean": mean_scores,
+    "min": min_scores,
+    "vote": vote_scores,
+    "normalized": normalized_scores,
+}
+
+
+def _unscored_to_inf(costs: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    return np.where(valid.any(axis=-1), costs, np.inf)
+
+
+# indices of the k lowest costs of each row, best first. Ties are broken by the lowest index, like min() on the labels.
+# argpartition finds the k best classes without sorting all the classes, only the k best classes are sorted.
+def top_k_indices(costs: np.ndarray, k: int) -> np.ndarray:
+    if k == 1:
+        return costs.argmin(axis=1)[:, np.newaxis]
+    if k >= costs.shape[1] or costs.shape[1] < PARTITION_MIN_CLASSES:
+        return np.argsort(costs, axis=1, kind="stable")[:, :k]
+    best = np.argpartition(costs, k - 1, axis=1)[:, :k]
+    best_costs = np.take_along_axis(costs, best, axis=1)
+    res = np.take_along_axis(best, np.lexsort((best, best_costs), axis=-1), axis=1)
+    # argpartition picks any of the classes that have the k-th cost: the lowest indices must be kept
+    kth = best_costs.max(axis=1, keepdims=True)
+    for i in np.flatnonzero((costs == kth).sum(axis=1) > (best_costs == kth).sum(axis=1)):
+        res[i] = np.argsort(costs[i], kind="stable")[:k]
+    return res
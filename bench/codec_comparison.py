@@ -0,0 +1,51 @@
+# Compares the compressor backends of COMPRESSOR_PROVIDERS on the same dataset:
+# fit time, dictionaries size, single prediction latency percentiles and accuracy.
+# Backends whose optional package is not installed are skipped.
+# run from the repository root: python -m bench.codec_comparison -d R8 -c ZSTD_CL9 -c LZ4 -c ZLIB_L9
+import time
+
+import click
+import numpy as np
+
+from bench.datasets import DATASET_TO_LOADER
+from compressorclassifier import CompressorClassifier
+from compressors.providers import COMPRESSOR_PROVIDERS
+
+
+@click.command()
+@click.option("-d", "--dataset", type=click.Choice(list(DATASET_TO_LOADER.keys())), default="R8")
+@click.option("-c", "--compressor", type=click.Choice(list(COMPRESSOR_PROVIDERS.keys())), multiple=True,
+              default=["ZSTD_CL9", "LZ4", "LZ4_HC9", "BROTLI_Q5", "ZLIB_L9", "LZ77_PY", "NGRAM_8"])
+@click.option("-cpc", "--compressors_per_class", type=int, default=1)
+@click.option("-s", "--size", type=int, default=-1)
+@click.option("-n", "--num_observations", help="Number of test observations to predict.", type=int, default=500)
+def run_benchmark(dataset, compressor, compressors_per_class, size, num_observations):
+    train_pair, test_pair = DATASET_TO_LOADER[dataset]()
+    test_pair = test_pair[:num_observations]
+    print(f"{dataset}: {len(test_pair)} observations, CPC {compressors_per_class}, size {size}.")
+    for name in compressor:
+        provider = COMPRESSOR_PROVIDERS[name]
+        try:
+            provider(size)
+        except ImportError as e:
+            print(f"{name}: skipped - {e}")
+            continue
+        classifier = CompressorClassifier(lambda: provider(size), num_compressors_per_class=compressors_per_class)
+        start = time.perf_counter()
+        classifier.fit(train_pair)
+        fit_time = time.perf_counter() - start
+
+        latencies_millis = []
+        correct = 0
+        for label, observation in test_pair:
+            start = time.perf_counter()
+            predicted = classifier.predict(observation)
+            latencies_millis.append((time.perf_counter() - start) * 1000)
+            correct += label in predicted
+        print(f"{name}: fit {round(fit_time, 2)}s, dictionaries {round(classifier.dictionaries_size() / 1e6, 3)}Mb, "
+              f"predict p50 {round(np.percentile(latencies_millis, 50), 3)}ms, "
+              f"p90 {round(np.percentile(latencies_millis, 90), 3)}ms, accuracy {round(correct / len(test_pair), 4)}.")
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,67 @@
+# Microbenchmark of the compressed length computation at prediction time.
+# Compares compress() + len() for each (text, compressor) pair with the size-only scoring of predict_batch.
+# Only measured numbers are printed: the time per observation and the peak traced memory. The size-only path writes all
+# the frames of a batch in one buffer per compressor: fewer, bigger allocations, so a higher peak.
+# run from the repository root: python -m bench.compressed_len -d R52
+import time
+import tracemalloc
+
+import click
+
+from bench.datasets import DATASET_TO_LOADER
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+
+
+def serial(classifier, texts):
+    return [classifier.predict(text) for text in texts]
+
+
+def size_only(classifier, texts):
+    return classifier.predict_batch(texts)
+
+
+def measure(fn, classifier, texts):
+    start = time.perf_counter()
+    predictions = fn(classifier, texts)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(classifier, texts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return predictions, duration, peak
+
+
+@click.command()
+@click.option("-d", "--dataset", type=click.Choice(list(DATASET_TO_LOADER.keys())), default="R52")
+@click.option("-cl", "--compression_level", type=int, default=9)
+@click.option("-cpc", "--compressors_per_class", type=int, default=5)
+@click.option("-s", "--size", type=int, default=-1)
+@click.option("-n", "--num_observations", help="Number of test observations to predict.", type=int, default=1000)
+def run_benchmark(dataset, compression_level, compressors_per_class, size, num_observations):
+    train_pair, test_pair = DATASET_TO_LOADER[dataset]()
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=size, compression_level=compression_level),
+                                      num_compressors_per_class=compressors_per_class)
+    classifier.fit(train_pair)
+    num_compressors = sum(len(c) for c in classifier.label_to_compressors.values())
+    texts = [observation for _, observation in test_pair[:num_observations]]
+    print(f"{dataset}: {len(classifier.label_to_compressors)} classes, {num_compressors} compressors, "
+          f"{len(texts)} observations.")
+
+    # warmup
+    serial(classifier, texts[:10])
+    size_only(classifier, texts[:10])
+
+    results = {}
+    for name, fn in [("compress_then_len", serial), ("size_only", size_only)]:
+        predictions, duration, peak = measure(fn, classifier, texts)
+        results[name] = predictions
+        print(f"{name}: {round(duration * 1000 / len(texts), 3)}ms per observation, "
+              f"peak traced memory {round(peak / 1e3, 1)}Kb.")
+    if results["compress_then_len"] != results["size_only"]:
+        raise AssertionError("size-only predictions differ from the serial predictions.")
+
+
+if __name__ == '__main__':
+    run_benchmark()
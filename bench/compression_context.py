@@ -0,0 +1,88 @@
+# Microbenchmark of the per-call cost of the zstd compression contexts.
+# Compares, for each dictionary of a trained classifier:
+# - new_context: a new zstandard.ZstdCompressor for each call, ie the context setup cost is paid for every input
+# - level_only: a reused context configured with the compression level only, with the default frame header
+# - explicit_params: the reused thread-local context of ZstdCompressor, with explicit compression parameters
+# The fixed overhead is measured on tiny inputs, the throughput on the test texts.
+# run from the repository root: python -m bench.compression_context -d R8
+import time
+
+import click
+import numpy as np
+import zstandard
+
+from bench.datasets import DATASET_TO_LOADER
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+
+TINY_INPUT = b"net profit"
+
+
+def new_context(compressor: ZstdCompressor):
+    return lambda data: zstandard.ZstdCompressor(dict_data=compressor.dictionary).compress(data)
+
+
+def level_only(compressor: ZstdCompressor):
+    dictionary = zstandard.ZstdCompressionDict(compressor.dictionary.as_bytes(), dict_type=compressor.dict_type)
+    dictionary.precompute_compress(level=compressor.compression_level)
+    return zstandard.ZstdCompressor(dict_data=dictionary).compress
+
+
+def explicit_params(compressor: ZstdCompressor):
+    return compressor._compressor().compress
+
+
+# best time per call over the repetitions, in microseconds, and the compressed lengths of shape (inputs, compressors)
+def measure(compress_fns, inputs, repetitions):
+    lengths = np.array([[len(compress(data)) for compress in compress_fns] for data in inputs])
+    best = float("inf")
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        for data in inputs:
+            for compress in compress_fns:
+                compress(data)
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6 / (len(inputs) * len(compress_fns)), lengths
+
+
+@click.command()
+@click.option("-d", "--dataset", type=click.Choice(list(DATASET_TO_LOADER.keys())), default="R8")
+@click.option("-cl", "--compression_level", type=int, default=9)
+@click.option("-cpc", "--compressors_per_class", type=int, default=1)
+@click.option("-s", "--size", type=int, default=-1)
+@click.option("-wl", "--window_log", help="Window log of the explicit parameters. 0 means derived from the level.",
+              type=int, default=0)
+@click.option("-st", "--strategy", help="zstd strategy of the explicit parameters. 0 means derived from the level.",
+              type=int, default=0)
+@click.option("-n", "--num_observations", help="Number of test observations to compress.", type=int, default=500)
+@click.option("-r", "--repetitions", type=int, default=5)
+def run_benchmark(dataset, compression_level, compressors_per_class, size, window_log, strategy, num_observations,
+                  repetitions):
+    train_pair, test_pair = DATASET_TO_LOADER[dataset]()
+    classifier = CompressorClassifier(
+        lambda: ZstdCompressor(size=size, compression_level=compression_level, window_log=window_log,
+                               strategy=strategy), num_compressors_per_class=compressors_per_class)
+    classifier.fit(train_pair)
+    labels = classifier.labels()
+    compressors = [c for compressors in classifier.label_to_compressors.values() for c in compressors]
+    compressor_labels = np.array([labels.index(label) for label, cs in classifier.label_to_compressors.items()
+                                  for _ in cs])
+    test_pair = test_pair[:num_observations]
+    texts = [observation.encode() for _, observation in test_pair]
+    expected = np.array([labels.index(label) if label in labels else -1 for label, _ in test_pair])
+    print(f"{dataset}: {len(labels)} classes, {len(compressors)} compressors, {len(texts)} observations.")
+
+    for name, make in [("new_context", new_context), ("level_only", level_only),
+                       ("explicit_params", explicit_params)]:
+        compress_fns = [make(c) for c in compressors]
+        tiny, _ = measure(compress_fns, [TINY_INPUT] * 100, repetitions)
+        texts_time, lengths = measure(compress_fns, texts, repetitions)
+        # best compressor of each text, as with CPC 1
+        accuracy = np.mean(compressor_labels[lengths.argmin(axis=1)] == expected)
+        print(f"{name}: {round(tiny, 2)}us per call on a {len(TINY_INPUT)} bytes input, {round(texts_time, 2)}us per "
+              f"call on the test texts, mean compressed length {round(lengths.mean(), 2)} bytes, accuracy "
+              f"{round(accuracy, 4)}.")
+
+
+if __name__ == '__main__':
+    run_benchmark()
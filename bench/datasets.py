@@ -0,0 +1,17 @@
+import os
+
+from bench.synthetic import generate
+from data import load_reuters, load_ohsumed_single_23
+
+DATA_DIR = "data"
+
+# bundled datasets and synthetic datasets. Use main.DATASET_TO_LOADER for the datasets that must be downloaded.
+DATASET_TO_LOADER = {
+    "R8": lambda: load_reuters(os.path.join(DATA_DIR, "R8")),
+    "R52": lambda: load_reuters(os.path.join(DATA_DIR, "R52")),
+    "Ohsumed": lambda: load_ohsumed_single_23(os.path.join(DATA_DIR, "ohsumed_single_23")),
+    "synthetic": lambda: generate(),
+    "synthetic_large": lambda: generate(num_classes=200, docs_per_class=500),
+    # very large label set, eg to benchmark the sharded classifier
+    "synthetic_5000": lambda: generate(num_classes=5000, docs_per_class=20, class_vocabulary_size=100),
+}
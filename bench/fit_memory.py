@@ -0,0 +1,55 @@
+# Benchmark of the memory used by fit, measured with tracemalloc.
+# The peak is compared with the size of the training set encoded in UTF-8.
+# tracemalloc only traces Python allocations: the memory allocated by zstd itself is not included.
+# With --corpus, the training set is held in a Corpus instead of a list of pairs. The memory traced to hold the training
+# set is printed too.
+# run from the repository root: python -m bench.fit_memory -d AmazonReviewPolarity --corpus
+import time
+import tracemalloc
+
+import click
+
+from compressorclassifier import CompressorClassifier
+from compressors.compressor import ENCODING, SEPARATOR
+from compressors.zstd_compressor import ZstdCompressor
+from corpus import Corpus
+
+
+@click.command()
+@click.option("-d", "--dataset", default="AmazonReviewPolarity", help="Dataset key in main.DATASET_TO_LOADER.")
+@click.option("-cl", "--compression_level", type=int, default=9)
+@click.option("-cpc", "--compressors_per_class", type=int, default=1)
+@click.option("-s", "--size", type=int, default=-1)
+@click.option("--corpus/--pairs", default=False, help="Hold the training set in a Corpus or in a list of pairs.")
+def run_benchmark(dataset, compression_level, compressors_per_class, size, corpus):
+    # import here: main imports the dataset libraries
+    from main import DATASET_TO_LOADER
+    tracemalloc.start()
+    train_pair = list(DATASET_TO_LOADER[dataset]()[0])
+    if corpus:
+        train_pair = Corpus.from_pairs(train_pair)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if corpus:
+        training_set_size = len(train_pair.buffer) - len(train_pair) * len(SEPARATOR)
+    else:
+        training_set_size = sum(len(observation.encode(ENCODING)) for _, observation in train_pair)
+    print(f"{dataset}: training set held in {'a Corpus' if corpus else 'a list of pairs'}: "
+          f"{round(held / 1e6, 1)} Mb traced.")
+
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=size, compression_level=compression_level),
+                                      num_compressors_per_class=compressors_per_class)
+    tracemalloc.start()
+    start = time.monotonic()
+    classifier.fit(train_pair if corpus else iter(train_pair))
+    fit_time = time.monotonic() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{dataset}: training set {round(training_set_size / 1e6, 1)} Mb, fit {round(fit_time, 1)}s, "
+          f"fit peak traced memory {round(peak / 1e6, 1)} Mb, "
+          f"{round(peak / training_set_size, 2)} x the training set size.")
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,72 @@
+# Benchmark of the dataset loaders of data.py on the bundled datasets.
+# For each file or directory, compares:
+# - list: the pairs are loaded in a list, like load_reuters and load_ohsumed_single_23 return them
+# - stream: the pairs are consumed one at a time from the iterator, and not kept
+# - stream_fit: the iterator is consumed by CompressorClassifier.fit, without building a list of pairs
+# Wall time is the best of the repetitions, with the files in the page cache. Peak memory is traced with tracemalloc.
+# run from the repository root: python -m bench.loaders
+import os
+import time
+import tracemalloc
+from collections import deque
+
+import click
+
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+from data import iter_label_directories, iter_reuters
+
+DATA_DIR = "data"
+
+
+def sources(threads: int):
+    return [
+        ("R8 train", lambda: iter_reuters(os.path.join(DATA_DIR, "R8", "train.txt"))),
+        ("R8 test", lambda: iter_reuters(os.path.join(DATA_DIR, "R8", "test.txt"))),
+        ("R52 test", lambda: iter_reuters(os.path.join(DATA_DIR, "R52", "test.txt"))),
+        (f"Ohsumed training, {threads} threads",
+         lambda: iter_label_directories(os.path.join(DATA_DIR, "ohsumed_single_23", "training"), threads)),
+        (f"Ohsumed test, {threads} threads",
+         lambda: iter_label_directories(os.path.join(DATA_DIR, "ohsumed_single_23", "test"), threads)),
+    ]
+
+
+def consumers():
+    return [
+        ("list", list),
+        # a deque of size 0 consumes the iterator without keeping the pairs
+        ("stream", lambda pairs: deque(pairs, maxlen=0)),
+        ("stream_fit", lambda pairs: CompressorClassifier(lambda: ZstdCompressor(size=-1)).fit(pairs)),
+    ]
+
+
+# best wall time over the repetitions, in milliseconds, and peak traced memory of one run, in Mb
+def measure(make_pairs, consume, repetitions):
+    best = float("inf")
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        consume(make_pairs())
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    consume(make_pairs())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1e6
+
+
+@click.command()
+@click.option("-t", "--threads", help="Threads reading the files of Ohsumed.", type=int, multiple=True, default=[1, 8])
+@click.option("-r", "--repetitions", type=int, default=5)
+def run_benchmark(threads, repetitions):
+    for t in threads:
+        for source_name, make_pairs in sources(t):
+            for consumer_name, consume in consumers():
+                if t != threads[0] and not source_name.startswith("Ohsumed"):
+                    continue
+                wall_time, peak = measure(make_pairs, consume, repetitions)
+                print(f"{source_name}, {consumer_name}: {round(wall_time, 1)}ms, peak traced memory "
+                      f"{round(peak, 1)} Mb.")
+
+
+if __name__ == '__main__':
+    run_benchmark()
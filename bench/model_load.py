@@ -0,0 +1,66 @@
+# Benchmark of the model file: save, load time and memory of a process loading the model, compared with fit.
+# run from the repository root: python -m bench.model_load -d AmazonReviewPolarity
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import click
+
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+
+
+def max_rss_mb() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac OS
+    return max_rss / 1e6 if sys.platform == "darwin" else max_rss / 1e3
+
+
+def load_in_fresh_process(path, queue):
+    rss_before = max_rss_mb()
+    start = time.monotonic()
+    classifier = CompressorClassifier.load(path)
+    load_time = time.monotonic() - start
+    queue.put((load_time, max_rss_mb() - rss_before, len(classifier.label_to_compressors)))
+
+
+@click.command()
+@click.option("-d", "--dataset", default="AmazonReviewPolarity", help="Dataset key in main.DATASET_TO_LOADER.")
+@click.option("-cl", "--compression_level", type=int, default=9)
+@click.option("-cpc", "--compressors_per_class", type=int, default=1)
+@click.option("-s", "--size", type=int, default=-1)
+@click.option("-m", "--model", "model_path", default=None,
+              help="Path of the model file. If the file exists, fit is skipped and the file is loaded.")
+@click.option("-r", "--repetitions", type=int, default=3)
+def run_benchmark(dataset, compression_level, compressors_per_class, size, model_path, repetitions):
+    if model_path is None:
+        model_path = f"{dataset}_CL{compression_level}_CPC{compressors_per_class}_S{size}.ftcc"
+    if not os.path.exists(model_path):
+        # import here: main imports the dataset libraries
+        from main import DATASET_TO_LOADER
+        train_pair, _ = DATASET_TO_LOADER[dataset]()
+        classifier = CompressorClassifier(lambda: ZstdCompressor(size=size, compression_level=compression_level),
+                                          num_compressors_per_class=compressors_per_class)
+        start = time.monotonic()
+        classifier.fit(train_pair)
+        print(f"fit: {round(time.monotonic() - start, 3)}s")
+        start = time.monotonic()
+        classifier.save(model_path)
+        print(f"save: {round(time.monotonic() - start, 3)}s")
+    print(f"model file: {model_path}, {os.path.getsize(model_path) / 1e6} Mb")
+
+    # a new process per load, so that the memory is not shared with a previous load
+    context = multiprocessing.get_context("spawn")
+    for _ in range(repetitions):
+        queue = context.Queue()
+        process = context.Process(target=load_in_fresh_process, args=(model_path, queue))
+        process.start()
+        load_time, rss_mb, num_classes = queue.get()
+        process.join()
+        print(f"load: {round(load_time, 3)}s, max RSS increase: {round(rss_mb, 1)} Mb, {num_classes} classes")
+
+
+if __name__ == '__main__':
+    run_benchmark()
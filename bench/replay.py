@@ -0,0 +1,62 @@
+# Load test client of serve.py. Replays a dataset file of "label\ttext" lines, like R8 test.txt, at a target QPS.
+# Requests are sent on schedule, without waiting for the previous responses.
+# run from the repository root, with a server running: python -m bench.replay -q 200
+import asyncio
+import json
+import time
+
+import click
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient
+
+
+async def send(client, url: str, label, text: str):
+    start = time.monotonic()
+    response = await client.fetch(url, method="POST", body=json.dumps({"text": text}), raise_error=False)
+    latency_millis = (time.monotonic() - start) * 1000
+    if response.code != 200:
+        return latency_millis, None
+    return latency_millis, label in json.loads(response.body)["labels"]
+
+
+# returns the results of the requests, the duration of the replay and the server metrics after the replay
+async def replay(url: str, pairs, qps: float):
+    AsyncHTTPClient.configure(None, max_clients=10000)
+    client = AsyncHTTPClient()
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    tasks = []
+    for i, (label, text) in enumerate(pairs):
+        await asyncio.sleep(max(0.0, start + i / qps - loop.time()))
+        tasks.append(asyncio.ensure_future(send(client, url + "/predict", label, text)))
+    results = await asyncio.gather(*tasks)
+    duration = loop.time() - start
+    metrics = await client.fetch(url + "/metrics")
+    return results, duration, json.loads(metrics.body)
+
+
+@click.command()
+@click.option("-u", "--url", default="http://localhost:8888")
+@click.option("-f", "--file", "filename", default="data/R8/test.txt", help="Dataset file with label\\ttext lines.")
+@click.option("-q", "--qps", help="Target number of requests per second.", type=float, default=100)
+@click.option("-n", "--num_requests", help="Number of requests. The file is replayed in a loop.", type=int,
+              default=2000)
+def run_load_test(url, filename, qps, num_requests):
+    with open(filename, encoding="utf-8") as f:
+        pairs = [line.split("\t", 1) for line in f.read().strip().split("\n")]
+    pairs = [pairs[i % len(pairs)] for i in range(num_requests)]
+
+    results, duration, metrics = asyncio.run(replay(url, pairs, qps))
+    latencies = [latency for latency, _ in results]
+    correct = [c for _, c in results if c is not None]
+    print(f"{len(results)} requests in {round(duration, 1)}s: {round(len(results) / duration, 1)} QPS "
+          f"(target {qps}), {len(results) - len(correct)} errors.")
+    print(f"latency p50: {round(np.percentile(latencies, 50), 3)}ms, p90: {round(np.percentile(latencies, 90), 3)}ms, "
+          f"p99: {round(np.percentile(latencies, 99), 3)}ms.")
+    if correct:
+        print(f"accuracy: {sum(correct) / len(correct)}")
+    print(f"server metrics: {metrics}")
+
+
+if __name__ == '__main__':
+    run_load_test()
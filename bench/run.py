@@ -0,0 +1,150 @@
+# Benchmark suite, separated from the accuracy experiment of main.py.
+# For each combination of dataset, compression level, CPC and size, measures:
+# fit throughput, single prediction latency percentiles, batch prediction throughput, peak RSS and model size.
+# Each case runs in a fresh process, so that the peak RSS is the one of the case.
+# Results are written as JSON, with the commit and the environment, to track regressions across commits.
+# run from the repository root: python -m bench.run -d R8 -d synthetic -o bench_results.json
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import numpy as np
+import zstandard
+
+from bench.datasets import DATASET_TO_LOADER
+from compressorclassifier import CompressorClassifier
+from compressors.compressor import ENCODING
+from compressors.zstd_compressor import ZstdCompressor
+
+
+def max_rss_mb() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac OS
+    return max_rss / 1e6 if sys.platform == "darwin" else max_rss / 1e3
+
+
+def percentiles(values) -> dict:
+    return {"p50": float(np.percentile(values, 50)), "p90": float(np.percentile(values, 90)),
+            "p99": float(np.percentile(values, 99)), "mean": float(np.mean(values))}
+
+
+def run_case(case: dict, warmup: int, repetitions: int, fit_repetitions: int, num_observations: int,
+             workers: int) -> dict:
+    train_pair, test_pair = DATASET_TO_LOADER[case["dataset"]]()
+    training_bytes = sum(len(observation.encode(ENCODING)) for _, observation in train_pair)
+    texts = [observation for _, observation in test_pair[:num_observations]]
+
+    fit_times = []
+    for _ in range(fit_repetitions):
+        classifier = CompressorClassifier(
+            lambda: ZstdCompressor(size=case["size"], compression_level=case["compression_level"]),
+            num_compressors_per_class=case["cpc"])
+        start = time.perf_counter()
+        classifier.fit(train_pair)
+        fit_times.append(time.perf_counter() - start)
+    fit_time = float(np.median(fit_times))
+
+    for _ in range(warmup):
+        for text in texts:
+            classifier.predict(text)
+    latencies_millis = []
+    for _ in range(repetitions):
+        for text in texts:
+            start = time.perf_counter()
+            classifier.predict(text)
+            latencies_millis.append((time.perf_counter() - start) * 1000)
+
+    for _ in range(warmup):
+        classifier.predict_batch(texts, workers=workers)
+    batch_throughputs = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        classifier.predict_batch(texts, workers=workers)
+        batch_throughputs.append(len(texts) / (time.perf_counter() - start))
+
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, "model.ftcc")
+        classifier.save(model_path)
+        model_file_bytes = os.path.getsize(model_path)
+
+    return {
+        **case,
+        "num_classes": len(classifier.label_to_compressors),
+        "num_compressors": sum(len(c) for c in classifier.label_to_compressors.values()),
+        "train_observations": len(train_pair),
+        "train_bytes": training_bytes,
+        "fit_seconds": fit_time,
+        "fit_mb_per_second": training_bytes / 1e6 / fit_time if fit_time > 0 else None,
+        "fit_observations_per_second": len(train_pair) / fit_time if fit_time > 0 else None,
+        "predict_observations": len(texts),
+        "predict_latency_millis": percentiles(latencies_millis),
+        "batch_workers": workers,
+        "batch_observations_per_second": float(np.median(batch_throughputs)),
+        "peak_rss_mb": max_rss_mb(),
+        "dictionaries_bytes": classifier.dictionaries_size(),
+        "model_file_bytes": model_file_bytes,
+    }
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "zstandard": zstandard.__version__,
+        "zstd": zstandard.ZSTD_VERSION,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+@click.command()
+@click.option("-d", "--dataset", type=click.Choice(list(DATASET_TO_LOADER.keys())), multiple=True,
+              default=["R8", "Ohsumed", "synthetic"])
+@click.option("-cl", "--compression_level", type=int, multiple=True, default=[9])
+@click.option("-cpc", "--compressors_per_class", type=int, multiple=True, default=[1, 5])
+@click.option("-s", "--size", type=int, multiple=True, default=[-1])
+@click.option("--warmup", help="Number of warmup passes on the observations, not measured.", type=int, default=1)
+@click.option("-r", "--repetitions", help="Number of measured passes on the observations.", type=int, default=3)
+@click.option("--fit_repetitions", help="Number of measured fits. The median is reported.", type=int, default=1)
+@click.option("-n", "--num_observations", help="Number of test observations to predict.", type=int, default=500)
+@click.option("-w", "--workers", help="Number of threads of the batch prediction.", type=int, default=1)
+@click.option("-o", "--output", help="JSON output file.", default="bench_results.json")
+def run_benchmark(dataset, compression_level, compressors_per_class, size, warmup, repetitions, fit_repetitions,
+                  num_observations, workers, output):
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for d, cl, cpc, s in itertools.product(dataset, compression_level, compressors_per_class, size):
+        case = {"dataset": d, "compression_level": cl, "cpc": cpc, "size": s}
+        print(f"Running {case}")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, case, warmup, repetitions, fit_repetitions, num_observations,
+                                     workers).result()
+        print(f"fit: {round(result['fit_seconds'], 3)}s, "
+              f"predict p50/p99: {round(result['predict_latency_millis']['p50'], 3)}ms/"
+              f"{round(result['predict_latency_millis']['p99'], 3)}ms, "
+              f"batch: {round(result['batch_observations_per_second'])} obs/s, "
+              f"peak RSS: {round(result['peak_rss_mb'])} Mb, model: {result['model_file_bytes'] / 1e6} Mb")
+        results.append(result)
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"metadata": metadata(), "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,63 @@
+# Benchmark of the sharded classifier against the classifier, on the same model.
+# Measures the batch prediction throughput for each number of shards. Shards load their classes from the model file.
+# Scaling is only expected up to the number of cores.
+# run from the repository root: python -m bench.sharded -d synthetic_5000 -sh 1 -sh 2 -sh 4
+import os
+import tempfile
+import time
+
+import click
+
+from bench.datasets import DATASET_TO_LOADER
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+from shardedclassifier import ShardedCompressorClassifier
+
+
+def throughput(predict_batch, texts, repetitions):
+    best = float("inf")
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        predictions = predict_batch(texts)
+        best = min(best, time.perf_counter() - start)
+    return predictions, len(texts) / best
+
+
+@click.command()
+@click.option("-d", "--dataset", type=click.Choice(list(DATASET_TO_LOADER.keys())), default="synthetic_5000")
+@click.option("-cl", "--compression_level", type=int, default=9)
+@click.option("-cpc", "--compressors_per_class", type=int, default=1)
+@click.option("-s", "--size", type=int, default=-1)
+@click.option("-sh", "--shards", help="Number of shards.", type=int, multiple=True,
+              default=sorted({1, 2, 4, os.cpu_count()}))
+@click.option("-n", "--num_observations", help="Number of test observations to predict.", type=int, default=200)
+@click.option("-r", "--repetitions", type=int, default=3)
+def run_benchmark(dataset, compression_level, compressors_per_class, size, shards, num_observations, repetitions):
+    train_pair, test_pair = DATASET_TO_LOADER[dataset]()
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=size, compression_level=compression_level),
+                                      num_compressors_per_class=compressors_per_class)
+    classifier.fit(train_pair)
+    texts = [observation for _, observation in test_pair[:num_observations]]
+    print(f"{dataset}: {len(classifier.label_to_compressors)} classes, {len(texts)} observations, "
+          f"{os.cpu_count()} cores.")
+
+    expected, base = throughput(classifier.predict_batch, texts, repetitions)
+    print(f"classifier: {round(base, 1)} observations/s.")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.ftcc")
+        classifier.save(path)
+        for num_shards in shards:
+            start = time.perf_counter()
+            with ShardedCompressorClassifier.load(path, num_shards) as sharded:
+                # starts the shard processes
+                sharded.predict(texts[0])
+                startup = time.perf_counter() - start
+                predictions, result = throughput(sharded.predict_batch, texts, repetitions)
+            if predictions != expected:
+                raise AssertionError(f"Predictions with {num_shards} shards differ from the classifier predictions.")
+            print(f"{num_shards} shards: {round(result, 1)} observations/s, speedup {round(result / base, 2)}x, "
+                  f"startup {round(startup, 2)}s.")
+
+
+if __name__ == '__main__':
+    run_benchmark()
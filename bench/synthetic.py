@@ -0,0 +1,31 @@
+import random
+import string
+from typing import List, Tuple
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+
+
+# Deterministic synthetic text classification dataset.
+# Each class has its own vocabulary, and all classes share a common vocabulary, like stop words in real texts.
+# class_word_ratio is the fraction of the words of a document drawn from the vocabulary of its class.
+def generate(num_classes=20, docs_per_class=200, words_per_doc=60, shared_vocabulary_size=2000,
+             class_vocabulary_size=300, class_word_ratio=0.3, test_ratio=0.2, seed=0) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    rng = random.Random(seed)
+    shared_vocabulary = [_word(rng) for _ in range(shared_vocabulary_size)]
+    train_pair = []
+    test_pair = []
+    for c in range(num_classes):
+        label = f"class_{c}"
+        class_vocabulary = [_word(rng) for _ in range(class_vocabulary_size)]
+        num_test = int(docs_per_class * test_ratio)
+        for i in range(docs_per_class):
+            words = [rng.choice(class_vocabulary) if rng.random() < class_word_ratio else rng.choice(shared_vocabulary)
+                     for _ in range(words_per_doc)]
+            (test_pair if i < num_test else train_pair).append((label, " ".join(words)))
+    # interleave the classes, like in real datasets
+    rng.shuffle(train_pair)
+    rng.shuffle(test_pair)
+    return train_pair, test_pair
@@ -0,0 +1,96 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, List
+
+from compressors.compressor import ENCODING
+
+# approximate memory of an entry, in addition to the key and the predicted labels: OrderedDict node, tuple, floats
+ENTRY_OVERHEAD_BYTES = 200
+
+
+# Bounded cache of predictions, keyed by a hash of the input text.
+# Entries are evicted in least recently used order when there are more than max_entries entries or when the
+# approximate memory of the entries is bigger than max_bytes. Entries older than ttl_seconds are not returned.
+# normalize is applied to texts before hashing: texts with the same normalized form share their prediction.
+# By default texts are not normalized, so that cached predictions are the same as the classifier predictions.
+# Thread safe.
+class PredictionCache:
+
+    def __init__(self, max_entries: int = 100000, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None,
+                 normalize: Optional[Callable[[str], str]] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.normalize = normalize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text: str) -> bytes:
+        if self.normalize is not None:
+            text = self.normalize(text)
+        return hashlib.blake2b(text.encode(ENCODING), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[List]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            # a copy, so that callers can't change the cached prediction
+            return list(entry[0])
+
+    def put(self, key: bytes, labels: List):
+        size = len(key) + sys.getsizeof(labels) + sum(sys.getsizeof(label) for label in labels) + ENTRY_OVERHEAD_BYTES
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (list(labels), time.monotonic(), size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes and self._entries):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+    def _remove(self, key: bytes):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    # the lock can't be pickled, eg to send a classifier to processes: the cache is sent empty
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_entries"] = OrderedDict()
+        state["bytes"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def collapse_whitespace(text: str) -> str:
+    return " ".join(text.split())
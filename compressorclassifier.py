@@ -1,55 +1,669 @@
-from collections import defaultdict
+from __future__ import annotations
+
+import copy
+import heapq
+import importlib
+import json
+import mmap
+import struct
+from array import array
+from collections import deque
+# the process pool is imported by concurrent.futures on first use: it is not imported when only threads are used
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from math import ceil
-from typing import Tuple, Callable, List
+from typing import Tuple, Callable, List, Iterable, Iterator, Dict, Union
+
+import numpy as np
+
+import instrumentation
+from aggregation import AGGREGATIONS, MISSING_SCORE, Aggregation, top_k_indices
+from cache import PredictionCache
+from compressors.compressor import Compressor, ENCODING, SEPARATOR, Data, split_buffer
+from corpus import Corpus, as_corpus
+from datastore import StoredSplit
+from sampling import ByteReservoir, sample
 
-from compressors.compressor import Compressor
+BACKENDS = ["thread", "process"]
+# number of chunks per worker in predict_batch - more chunks balance better the load, fewer chunks reduce the overhead
+CHUNKS_PER_WORKER = 4
+# number of chunks per worker submitted at a time in a parallel fit - enough to keep the workers busy, few enough that
+# the chunks waiting to be trained don't hold the training set
+FIT_PENDING_CHUNKS_PER_WORKER = 2
+# aggregations that can only compare classes with the same number of compressors
+COUNT_DEPENDENT_AGGREGATIONS = ["sum", "vote"]
+# the shared dictionary is trained on a sample of the training texts of this many times its size, as zstd recommends
+SHARED_DICTIONARY_SAMPLES_RATIO = 100
+
+# model file format: preamble (magic, version, header length), json header, then the dictionaries.
+# The header indexes each dictionary by its offset from the start of the dictionaries section.
+MODEL_MAGIC = b"FTCC"
+MODEL_VERSION = 1
+MODEL_PREAMBLE = struct.Struct("<4sIQ")
+MODEL_ALIGNMENT = 8
 
 
 class CompressorClassifier:
 
     # if top_k is set to > 1, cheat as described in https://github.com/bazingagin/npc_gzip/issues/3
     # only set top_k=2 to show how cheating improves accuracy performance by a crazy amount
-    def __init__(self, compressor_provider: Callable[[], Compressor], top_k=1, num_compressors_per_class=1):
+    # if cascade_prefix is set to > 0, predictions are cascaded: the first cascade_prefix bytes of the input are scored
+    # against all classes, then the whole input is only scored against the cascade_keep fraction of best classes.
+    # if sample_budget is set to > 0, the texts of each class are sampled to sample_budget bytes before the training,
+    # with a reservoir sampler seeded with seed. Training is faster and the memory used is bounded.
+    # if cache is set, predictions are cached by input text. The cache is cleared when the classifier is trained.
+    # aggregation reduces the scores of the compressors of a class: a name in AGGREGATIONS, or a function.
+    # Only named aggregations can be saved.
+    # if shared_dictionary_size is set to > 0, a dictionary of the content common to all classes is trained on the texts
+    # of all classes, then layered under the dictionary of each compressor. The shared dictionary is saved once, the
+    # compressors of each class only keep their class texts. Requires compressors that implement
+    # set_shared_dictionary, eg zstd with size -1.
+    # if compressor_budget is set to > 0, num_compressors_per_class is ignored: each class gets a number of compressors
+    # that depends on its size in bytes, with compressor_budget compressors in total. See _allocate_compressors.
+    # Classes then have different numbers of compressors: the aggregation can't be one of COUNT_DEPENDENT_AGGREGATIONS,
+    # eg with sum, classes with fewer compressors get lower costs. Use mean or min.
+    def __init__(self, compressor_provider: Callable[[], Compressor], top_k=1, num_compressors_per_class=1,
+                 cascade_prefix=0, cascade_keep=0.2, sample_budget=0, seed=0, cache: PredictionCache = None,
+                 aggregation: Union[str, Aggregation] = "sum", shared_dictionary_size=0, compressor_budget=0):
         self.compressor_provider = compressor_provider
         if top_k < 1:
             raise ValueError("Invalid top_k value. Correct value is 1. Cheat is 2 or more.")
         self.top_k = top_k
         self.num_compressors_per_class = num_compressors_per_class
+        if cascade_prefix < 0:
+            raise ValueError("Invalid cascade_prefix value. Must be 0 (no cascade) or a number of bytes.")
+        if not 0 < cascade_keep <= 1:
+            raise ValueError("Invalid cascade_keep value. Must be a fraction in ]0, 1].")
+        self.cascade_prefix = cascade_prefix
+        self.cascade_keep = cascade_keep
+        if sample_budget < 0:
+            raise ValueError("Invalid sample_budget value. Must be 0 (no sampling) or a number of bytes.")
+        self.sample_budget = sample_budget
+        self.seed = seed
+        self.cache = cache
+        if isinstance(aggregation, str) and aggregation not in AGGREGATIONS:
+            raise ValueError(f"Invalid aggregation: {aggregation}. Valid aggregations: {list(AGGREGATIONS)}")
+        self.aggregation = aggregation
+        if shared_dictionary_size < 0:
+            raise ValueError("Invalid shared_dictionary_size value. Must be 0 (no shared dictionary) or a number of "
+                             "bytes.")
+        self.shared_dictionary_size = shared_dictionary_size
+        self.shared_dictionary = None
+        if compressor_budget < 0:
+            raise ValueError("Invalid compressor_budget value. Must be 0 (num_compressors_per_class compressors per "
+                             "class) or a number of compressors.")
+        if compressor_budget > 0 and isinstance(aggregation, str) and aggregation in COUNT_DEPENDENT_AGGREGATIONS:
+            raise ValueError(f"Aggregation {aggregation} can't be used with a compressor_budget: classes have different "
+                             f"numbers of compressors. Use mean or min.")
+        self.compressor_budget = compressor_budget
+        # with a compressor_budget, the average number of training bytes per compressor of the last fit. Used to choose
+        # the number of compressors of the classes added later.
+        self.compressor_bytes = 0
+        # compressors of each class, in the order of the labels. Empty until fit, or built class by class with
+        # add_class.
+        self.label_to_compressors: Dict[object, List[Compressor]] = {}
 
     # train_pair is a list of [(label, observation), ...
-    # todo see if string concatenation can be improved
-    def fit(self, train_pair: List[Tuple[str, str]]):
-        # concatenate strings that have the same labels
-        label_to_texts = defaultdict(list)
-        for label, observation in train_pair:
-            label_to_texts[label].append(observation)
+    # with workers > 1, the compressors are trained in parallel. The compressors are the same as with a serial fit.
+    # backend "process" requires a compressor_provider that can be sent to processes on platforms that spawn processes.
+    # train_pair can be an iterator: the pairs are consumed once and not kept in memory.
+    # train_pair can be a Corpus or a StoredSplit: the texts are grouped by class in the arrays of the corpus, and the
+    # compressors are trained on slices of its buffer, without a Python object per text.
+    def fit(self, train_pair: Union[Corpus, StoredSplit, Iterable[Tuple[str, str]]], workers=1, backend="thread"):
+        _check_backend(backend)
+        if self.shared_dictionary_size > 0 and not self.compressor_provider().supports_shared_dictionary():
+            raise ValueError("The compressors can't be layered on a shared dictionary. Use shared_dictionary_size=0, "
+                             "or compressors that implement set_shared_dictionary, eg zstd with size -1.")
+        start = instrumentation.start()
+        # samples of the texts of all classes, for the shared dictionary
+        shared_reservoir = None
+        if self.shared_dictionary_size > 0:
+            shared_reservoir = ByteReservoir(SHARED_DICTIONARY_SAMPLES_RATIO * self.shared_dictionary_size, self.seed)
+        if isinstance(train_pair, (Corpus, StoredSplit)):
+            label_to_buffer = self._corpus_buffers(train_pair, shared_reservoir)
+        else:
+            label_to_buffer = self._pairs_buffers(train_pair, shared_reservoir)
+        instrumentation.record("fit.encode_join", start,
+                               bytes_out=sum(len(buffer) for buffer, _ in label_to_buffer.values()))
 
+        self._invalidate()
+        self.shared_dictionary = None
+        if shared_reservoir is not None:
+            start = instrumentation.start()
+            self.shared_dictionary = self.compressor_provider().train_shared_dictionary(
+                shared_reservoir.items(), self.shared_dictionary_size)
+            instrumentation.record("fit.shared_dictionary", start, bytes_out=len(self.shared_dictionary))
         self.label_to_compressors = {}
-        for label, texts in label_to_texts.items():
-            compressors = []
-            step = ceil(len(texts) / self.num_compressors_per_class)
-            for i in range(0, len(texts), step):
-                compressor = self.compressor_provider().fit(texts[i:i + step])
-                compressors.append(compressor)
-            self.label_to_compressors[label] = compressors
+        label_to_num_compressors = self._layout(label_to_buffer)
+        for label, compressor in self._fit_chunks(self._pop_chunks(label_to_buffer, label_to_num_compressors), workers,
+                                                  backend):
+            self.label_to_compressors.setdefault(label, []).append(compressor)
+
+    # concatenate texts that have the same labels: one growable buffer of encoded texts per label
+    def _pairs_buffers(self, train_pair: Iterable[Tuple[str, str]], shared_reservoir: ByteReservoir) \
+            -> Dict[str, Tuple[bytearray, array]]:
+        label_to_buffer = {}
+        if self.sample_budget > 0:
+            label_to_reservoir = {}
+            for label, observation in train_pair:
+                if label not in label_to_reservoir:
+                    label_to_reservoir[label] = ByteReservoir(self.sample_budget, self.seed)
+                data = observation.encode(ENCODING)
+                label_to_reservoir[label].add(data)
+                if shared_reservoir is not None:
+                    shared_reservoir.add(data)
+            for label in list(label_to_reservoir):
+                label_to_buffer[label] = _join(label_to_reservoir.pop(label).items())
+        else:
+            for label, observation in train_pair:
+                if label not in label_to_buffer:
+                    label_to_buffer[label] = (bytearray(), array("Q"))
+                data = observation.encode(ENCODING)
+                _append(*label_to_buffer[label], data)
+                if shared_reservoir is not None:
+                    shared_reservoir.add(data)
+        return label_to_buffer
+
+    # the buffer of a label is a view of the grouped corpus. Texts are sampled and added to the shared reservoir in the
+    # order of the corpus, like the pairs: the compressors are the same as with the pairs of the corpus.
+    def _corpus_buffers(self, corpus: Union[Corpus, StoredSplit], shared_reservoir: ByteReservoir) \
+            -> Dict[str, Tuple[Data, np.ndarray]]:
+        if shared_reservoir is not None:
+            for data in corpus.data():
+                shared_reservoir.add(bytes(data))
+        label_to_buffer = {label: (buffer, starts) for label, buffer, starts in
+                           as_corpus(corpus, grouped=True).classes()}
+        if self.sample_budget > 0:
+            for label, (buffer, starts) in label_to_buffer.items():
+                label_to_buffer[label] = _join(sample(split_buffer(buffer, starts), self.sample_budget, self.seed))
+        return label_to_buffer
+
+    # partial - per-class - training. Only the compressors of the label are trained, other classes are not changed.
+    def add_class(self, label, texts: List[str], workers=1, backend="thread"):
+        _check_backend(backend)
+        if label in self.label_to_compressors:
+            raise ValueError(f"Class {label} already exists. Use update_class to change it.")
+        self.label_to_compressors[label] = self._fit_class(label, texts, workers, backend)
+        self._invalidate()
+
+    # by default, the compressors of the label are trained again with texts only.
+    # with append=True, texts are added to the existing compressors, split evenly between them. The class texts are
+    # not joined again: only compressors that keep their training data as a raw prefix (eg zstd with size -1) support it.
+    def update_class(self, label, texts: List[str], append=False, workers=1, backend="thread"):
+        _check_backend(backend)
+        if label not in self.label_to_compressors:
+            raise ValueError(f"Unknown class {label}. Use add_class to create it.")
+        if not append:
+            self.label_to_compressors[label] = self._fit_class(label, texts, workers, backend)
+        else:
+            compressors = self.label_to_compressors[label]
+            step = ceil(len(texts) / len(compressors))
+            for i, compressor in enumerate(compressors):
+                compressor.extend(texts[i * step:(i + 1) * step])
+        self._invalidate()
+
+    def remove_class(self, label):
+        if label not in self.label_to_compressors:
+            raise ValueError(f"Unknown class {label}.")
+        del self.label_to_compressors[label]
+        self._invalidate()
+
+    # cached predictions were made by the previous compressors
+    def _invalidate(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    # number of compressors of each class
+    def _layout(self, label_to_buffer: Dict[str, Tuple[Data, array]]) -> Dict[str, int]:
+        if self.compressor_budget <= 0:
+            return {label: self.num_compressors_per_class for label in label_to_buffer}
+        labels = list(label_to_buffer)
+        sizes = [len(label_to_buffer[label][0]) for label in labels]
+        self.compressor_bytes = sum(sizes) / max(self.compressor_budget, len(labels))
+        return dict(zip(labels, _allocate_compressors(sizes, [len(label_to_buffer[label][1]) for label in labels],
+                                                      self.compressor_budget)))
+
+    # classes added after the fit get about the same number of bytes per compressor as the other classes
+    def _num_compressors(self, buffer: bytearray, starts: array) -> int:
+        if self.compressor_budget <= 0:
+            return self.num_compressors_per_class
+        if self.compressor_bytes <= 0:
+            raise ValueError("With a compressor_budget, fit the classifier before adding classes: the number of "
+                             "compressors of a class added depends on the bytes per compressor of the fit.")
+        return max(1, min(len(starts), round(len(buffer) / self.compressor_bytes)))
+
+    # the texts of a class are split in num_compressors chunks, one compressor is trained per chunk.
+    # chunks are zero-copy views of the class buffer, with the offsets of the texts in the chunk. The offsets are
+    # computed with numpy, without a Python int per text.
+    # With num_compressors_per_class, chunks have ceil(n / num_compressors) texts: a small class can get fewer chunks.
+    # With a compressor_budget, exactly num_compressors chunks - or one per text if there are fewer texts - like
+    # numpy.array_split: the first chunks get one more text. The layout printed and saved is the one built.
+    def _split(self, buffer: Data, starts: Union[array, np.ndarray], num_compressors: int) \
+            -> List[Tuple[memoryview, array]]:
+        if len(starts) == 0:
+            raise ValueError("A class needs at least one text.")
+        starts = np.asarray(starts, dtype=np.uint64)
+        if self.compressor_budget <= 0:
+            step = ceil(len(starts) / num_compressors)
+            bounds = list(range(0, len(starts), step)) + [len(starts)]
+        else:
+            num_compressors = min(num_compressors, len(starts))
+            step, extra = divmod(len(starts), num_compressors)
+            bounds = [0]
+            for i in range(num_compressors):
+                bounds.append(bounds[-1] + step + (1 if i < extra else 0))
+        view = memoryview(buffer)
+        chunks = []
+        for i, j in zip(bounds[:-1], bounds[1:]):
+            begin = int(starts[i])
+            end = int(starts[j]) - len(SEPARATOR) if j < len(starts) else len(view)
+            chunks.append((view[begin:end], array("Q", (starts[i:j] - starts[i]).tobytes())))
+        return chunks
+
+    # chunks of all classes, in the order of the labels. A class buffer is released once its chunks are trained.
+    def _pop_chunks(self, label_to_buffer: Dict[str, Tuple[Data, array]], label_to_num_compressors: Dict[str, int]):
+        while label_to_buffer:
+            label = next(iter(label_to_buffer))
+            for buffer, starts in self._split(*label_to_buffer.pop(label), label_to_num_compressors[label]):
+                yield label, buffer, starts
+
+    def _fit_class(self, label, texts: List[str], workers, backend) -> List[Compressor]:
+        start = instrumentation.start()
+        data = [text.encode(ENCODING) for text in texts]
+        if self.sample_budget > 0:
+            data = sample(data, self.sample_budget, self.seed)
+        buffer, starts = _join(data)
+        instrumentation.record("fit.encode_join", start, bytes_out=len(buffer))
+        chunks = [(label, chunk, chunk_starts) for chunk, chunk_starts in
+                  self._split(buffer, starts, self._num_compressors(buffer, starts))]
+        return [compressor for _, compressor in self._fit_chunks(chunks, workers, backend)]
+
+    # with workers > 1, the compressors are trained in parallel. Compressors are returned in the order of the chunks,
+    # with the label of their chunk. At most FIT_PENDING_CHUNKS_PER_WORKER chunks per worker are submitted at a time:
+    # the chunks are taken from the iterator - and copied, for processes - when a worker is about to train them.
+    def _fit_chunks(self, chunks: Iterable[Tuple[str, memoryview, array]], workers, backend) \
+            -> List[Tuple[str, Compressor]]:
+        if workers <= 1:
+            fitted = [(label, self._fit_chunk(label, buffer, starts)) for label, buffer, starts in chunks]
+        elif backend == "thread":
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                fitted = list(_map_bounded(executor, lambda chunk: (chunk[0], self._fit_chunk(*chunk)), chunks,
+                                           workers * FIT_PENDING_CHUNKS_PER_WORKER))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_fit_worker,
+                                                        initargs=(self.compressor_provider,)) as executor:
+                # memoryviews can't be sent to processes: chunks are copied
+                fitted = list(_map_bounded(executor, _fit_in_worker,
+                                           ((label, bytes(buffer), starts) for label, buffer, starts in chunks),
+                                           workers * FIT_PENDING_CHUNKS_PER_WORKER))
+        return [(label, self._layer(compressor)) for label, compressor in fitted]
+
+    def _fit_chunk(self, label, buffer: memoryview, starts: array) -> Compressor:
+        start = instrumentation.start()
+        compressor = self.compressor_provider().fit_buffer(buffer, starts)
+        instrumentation.record("fit.compressor", start, bytes_in=len(buffer), label=label)
+        return compressor
+
+    # the shared dictionary is layered once the compressors are back: it is not sent to the worker processes
+    def _layer(self, compressor: Compressor) -> Compressor:
+        if self.shared_dictionary is None:
+            return compressor
+        return compressor.set_shared_dictionary(self.shared_dictionary)
 
     def predict(self, text):
-        label_to_scores = {label: [c.get_compressed_len(text) for c in compressors] for label, compressors in
-                           self.label_to_compressors.items()}
-
-        # TODO CYRIL add DI for the strategy on how to pick
-        # reduced scores could be a vote, a sum, etc. not sure for the moment take the sum
-        label_to_score = {label: sum(scores) for label, scores in label_to_scores.items()}
-        res = []
-        for _ in range(self.top_k):
-            predicted = min(label_to_score, key=label_to_score.get)
-            label_to_score.pop(predicted)
-            res.append(predicted)
-        return res
+        if self.cache is None:
+            return self._predict_chunk([text])[0]
+        key = self.cache.key(text)
+        predicted = self.cache.get(key)
+        if predicted is None:
+            predicted = self._predict_chunk([text])[0]
+            self.cache.put(key, predicted)
+        return predicted
+
+    # returns the predictions in the order of the texts. Results are the same as calling predict on each text.
+    # backend "thread": compressors release the GIL when compressing, threads run in parallel.
+    # backend "process": each worker process receives the compressors once, only texts and predictions are sent.
+    def predict_batch(self, texts: List[str], workers=1, backend="thread") -> List[List[str]]:
+        _check_backend(backend)
+        if self.cache is None:
+            return self._predict_batch(texts, workers, backend)
+        keys = [self.cache.key(text) for text in texts]
+        predictions = [self.cache.get(key) for key in keys]
+        # duplicates in the batch are only predicted once
+        key_to_text = {}
+        for key, text, predicted in zip(keys, texts, predictions):
+            if predicted is None:
+                key_to_text.setdefault(key, text)
+        # when all the texts are cached, nothing is scored
+        key_to_predicted = {}
+        if key_to_text:
+            key_to_predicted = dict(zip(key_to_text, self._predict_batch(list(key_to_text.values()), workers,
+                                                                         backend)))
+        for key, predicted in key_to_predicted.items():
+            self.cache.put(key, predicted)
+        return [list(key_to_predicted[key]) if predicted is None else predicted for key, predicted in
+                zip(keys, predictions)]
+
+    def _predict_batch(self, texts: List[str], workers: int, backend: str) -> List[List[str]]:
+        return [predicted for chunk_result in self._map_chunks("_predict_chunk", texts, workers, backend) for
+                predicted in chunk_result]
+
+    # compressed lengths of the texts for all the compressors, of shape (n_texts, n_labels, n_compressors).
+    # labels are in the order of labels(). MISSING_SCORE where a class has fewer compressors than the others.
+    # All classes are scored: the cascade is not applied. Scores can be reduced with any aggregation, eg to calibrate
+    # predictions or to compare aggregations, without compressing the texts again.
+    def score_batch(self, texts: List[str], workers=1, backend="thread") -> np.ndarray:
+        _check_backend(backend)
+        return np.concatenate(self._map_chunks("_score_chunk", texts, workers, backend))
+
+    def labels(self) -> List:
+        return list(self.label_to_compressors)
+
+    # runs method on chunks of texts, in parallel if workers > 1. Returns the results of the chunks, in order.
+    def _map_chunks(self, method: str, texts: List[str], workers: int, backend: str) -> List:
+        if workers <= 1 or len(texts) <= 1:
+            return [getattr(self, method)(texts)]
+
+        step = ceil(len(texts) / (workers * CHUNKS_PER_WORKER))
+        chunks = [texts[i:i + step] for i in range(0, len(texts), step)]
+        if backend == "thread":
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(getattr(self, method), chunks))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(self._without_provider(),)) as executor:
+            return list(executor.map(_call_in_worker, [method] * len(chunks), chunks))
+
+    # the compressor_provider is not needed for predictions, and lambdas can't be sent to processes
+    def _without_provider(self):
+        classifier = copy.copy(self)
+        classifier.compressor_provider = None
+        # workers don't use the cache: cached predictions are looked up before texts are sent
+        classifier.cache = None
+        return classifier
+
+    # size-only scoring: each compressor scores the whole chunk at once instead of one text at a time
+    def _predict_chunk(self, texts: List[str]) -> List[List[str]]:
+        start = instrumentation.start()
+        data = [text.encode(ENCODING) for text in texts]
+        lengths = np.array([len(d) for d in data], dtype=np.int64)
+        instrumentation.record("predict.encode", start, calls=len(texts), bytes_out=int(lengths.sum()))
+        if self.cascade_prefix > 0 and self._num_candidates() < len(self.label_to_compressors):
+            # first stage in size-only mode, the second stage only scores a few classes per input
+            scores = self._score_matrix([memoryview(d)[:self.cascade_prefix] for d in data])
+            start = instrumentation.start()
+            candidates = top_k_indices(self._aggregate(scores, np.minimum(lengths, self.cascade_prefix)),
+                               self._num_candidates())
+            instrumentation.record("predict.cascade_prune", start, calls=len(texts))
+            compressors = list(self.label_to_compressors.values())
+            start = instrumentation.start()
+            for i, d in enumerate(data):
+                # if the input is not longer than the prefix, the prefix scores are already the final scores
+                if self._cascades(d):
+                    scores[i] = MISSING_SCORE
+                    for j in candidates[i]:
+                        for k, c in enumerate(compressors[j]):
+                            scores[i, j, k] = c.get_compressed_len_bytes(d)
+            instrumentation.record("predict.cascade_score", start, calls=len(texts))
+        else:
+            scores = self._score_matrix(data)
+        start = instrumentation.start()
+        predictions = self._pick(scores, lengths)
+        instrumentation.record("predict.aggregate", start, calls=len(texts))
+        return predictions
+
+    def _score_chunk(self, texts: List[str]) -> np.ndarray:
+        return self._score_matrix([text.encode(ENCODING) for text in texts])
+
+    def _score_matrix(self, data: List[Data]) -> np.ndarray:
+        num_compressors = max((len(compressors) for compressors in self.label_to_compressors.values()), default=0)
+        scores = np.full((len(data), len(self.label_to_compressors), num_compressors), MISSING_SCORE, dtype=np.int32)
+        if instrumentation.active() is not None:
+            return self._score_matrix_instrumented(data, scores)
+        for j, compressors in enumerate(self.label_to_compressors.values()):
+            for k, c in enumerate(compressors):
+                scores[:, j, k] = c.get_compressed_lens_bytes(data)
+        return scores
+
+    # same as _score_matrix, with a counter per compressor: the slowest dictionaries can be found
+    def _score_matrix_instrumented(self, data: List[Data], scores: np.ndarray) -> np.ndarray:
+        score_start = instrumentation.start()
+        bytes_in = sum(len(d) for d in data)
+        for j, (label, compressors) in enumerate(self.label_to_compressors.items()):
+            for k, c in enumerate(compressors):
+                start = instrumentation.start()
+                scores[:, j, k] = c.get_compressed_lens_bytes(data)
+                instrumentation.record("predict.compress", start, calls=len(data), bytes_in=bytes_in,
+                                       bytes_out=int(scores[:, j, k].sum()), label=label, compressor=k)
+        instrumentation.record("predict.score", score_start, calls=len(data), bytes_in=bytes_in)
+        return scores
+
+    # cascading is only useful if the input is longer than the prefix and some classes can be pruned
+    def _cascades(self, data) -> bool:
+        return 0 < self.cascade_prefix < len(data) and self._num_candidates() < len(self.label_to_compressors)
+
+    def _num_candidates(self) -> int:
+        return max(self.top_k, ceil(self.cascade_keep * len(self.label_to_compressors)))
+
+    def _aggregate(self, scores: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        aggregation = AGGREGATIONS[self.aggregation] if isinstance(self.aggregation, str) else self.aggregation
+        return aggregation(scores, lengths)
+
+    def _pick(self, scores: np.ndarray, lengths: np.ndarray) -> List[List[str]]:
+        labels = self.labels()
+        return [[labels[j] for j in best] for best in top_k_indices(self._aggregate(scores, lengths), self.top_k)]
 
     def dictionaries_size(self) -> int:
         s = 0
         for compressors in self.label_to_compressors.values():
             for c in compressors:
                 s += c.dictionary_size()
+        if self.shared_dictionary is not None:
+            s += len(self.shared_dictionary)
         return s
+
+    # labels must be str, int, float or bool. The compressor_provider is not saved.
+    def save(self, path: str):
+        if not isinstance(self.aggregation, str):
+            raise ValueError("Custom aggregation functions can't be saved. Use an aggregation of AGGREGATIONS.")
+        classes = []
+        dictionaries = []
+        offset = 0
+        # the shared dictionary is the first dictionary of the file
+        shared_entry = None
+        if self.shared_dictionary is not None:
+            shared_entry = {"offset": offset, "length": len(self.shared_dictionary)}
+            dictionaries.append(self.shared_dictionary)
+            offset += _aligned(len(self.shared_dictionary))
+        for label, compressors in self.label_to_compressors.items():
+            entries = []
+            for c in compressors:
+                dictionary = c.get_dictionary()
+                entries.append({"type": f"{type(c).__module__}.{type(c).__qualname__}", "params": c.get_params(),
+                                "offset": offset, "length": len(dictionary)})
+                dictionaries.append(dictionary)
+                offset += _aligned(len(dictionary))
+            classes.append({"label": _json_label(label), "compressors": entries})
+        header = json.dumps({
+            "top_k": self.top_k,
+            "num_compressors_per_class": self.num_compressors_per_class,
+            "cascade_prefix": self.cascade_prefix,
+            "cascade_keep": self.cascade_keep,
+            "sample_budget": self.sample_budget,
+            "seed": self.seed,
+            "aggregation": self.aggregation,
+            "shared_dictionary_size": self.shared_dictionary_size,
+            "shared_dictionary": shared_entry,
+            "compressor_budget": self.compressor_budget,
+            "compressor_bytes": self.compressor_bytes,
+            "classes": classes,
+        }).encode(ENCODING)
+
+        with open(path, "wb") as f:
+            f.write(MODEL_PREAMBLE.pack(MODEL_MAGIC, MODEL_VERSION, len(header)))
+            f.write(header)
+            f.write(_padding(MODEL_PREAMBLE.size + len(header)))
+            for dictionary in dictionaries:
+                f.write(dictionary)
+                f.write(_padding(len(dictionary)))
+
+    # the model file is memory-mapped while it is read, then closed: each dictionary is read once from the file and
+    # copied by its compressor, eg zstd copies it in its dictionary and in its precomputed compression context.
+    # Processes that load the same model don't share the memory of the dictionaries.
+    # set compressor_provider to be able to fit the loaded classifier again. The cache is not saved, it starts empty.
+    # if labels is set, only the classes in labels are loaded, in the order of the model file. eg to load a shard.
+    @classmethod
+    def load(cls, path: str, compressor_provider: Callable[[], Compressor] = None,
+             cache: PredictionCache = None, labels: Iterable = None) -> CompressorClassifier:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header, start = _read_header(mm, path)
+            if labels is not None:
+                labels = set(labels)
+
+            classifier = cls(compressor_provider, header["top_k"],
+                             num_compressors_per_class=header["num_compressors_per_class"],
+                             cascade_prefix=header["cascade_prefix"], cascade_keep=header["cascade_keep"],
+                             sample_budget=header.get("sample_budget", 0), seed=header.get("seed", 0), cache=cache,
+                             aggregation=header.get("aggregation", "sum"),
+                             shared_dictionary_size=header.get("shared_dictionary_size", 0),
+                             compressor_budget=header.get("compressor_budget", 0))
+            classifier.compressor_bytes = header.get("compressor_bytes", 0)
+            classifier.label_to_compressors = {}
+            with memoryview(mm) as view:
+                # the shared dictionary is copied in each compressor when it is layered: it is read once from the file
+                shared_entry = header.get("shared_dictionary")
+                if shared_entry is not None:
+                    with view[start + shared_entry["offset"]:
+                              start + shared_entry["offset"] + shared_entry["length"]] as shared:
+                        classifier.shared_dictionary = bytes(shared)
+                for entry in header["classes"]:
+                    if labels is not None and entry["label"] not in labels:
+                        continue
+                    compressors = []
+                    for c in entry["compressors"]:
+                        compressor_class = _compressor_class(c["type"])
+                        # views must be released before the file is unmapped
+                        with view[start + c["offset"]:start + c["offset"] + c["length"]] as dictionary:
+                            compressors.append(classifier._layer(
+                                compressor_class.from_dictionary(c["params"], dictionary)))
+                    classifier.label_to_compressors[entry["label"]] = compressors
+        return classifier
+
+
+# the header of a model file, without loading the dictionaries: parameters, and labels and compressors of each class
+def load_header(path: str) -> dict:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return _read_header(mm, path)[0]
+
+
+# returns the header and the offset of the dictionaries section
+def _read_header(mm: mmap.mmap, path: str) -> Tuple[dict, int]:
+    magic, version, header_len = MODEL_PREAMBLE.unpack_from(mm)
+    if magic != MODEL_MAGIC:
+        raise ValueError(f"Invalid model file: {path}.")
+    if version != MODEL_VERSION:
+        raise ValueError(f"Unsupported model file version: {version}. Supported version: {MODEL_VERSION}")
+    header = json.loads(mm[MODEL_PREAMBLE.size:MODEL_PREAMBLE.size + header_len].decode(ENCODING))
+    return header, _aligned(MODEL_PREAMBLE.size + header_len)
+
+
+# number of compressors of each class, for classes of sizes bytes with num_texts texts, and budget compressors in
+# total. Each class gets one compressor, then the extra compressors go one by one to the class with the most bytes per
+# compressor. Compressors get about the same number of bytes: big classes are split, small classes are not.
+# A class never gets more compressors than texts, so the budget may not be used entirely.
+def _allocate_compressors(sizes: List[int], num_texts: List[int], budget: int) -> List[int]:
+    if budget < len(sizes):
+        raise ValueError(f"Invalid compressor_budget value: {budget}. Each class needs a compressor: the budget must be "
+                         f"at least the number of classes, {len(sizes)}.")
+    counts = [1] * len(sizes)
+    heap = [(-size, i) for i, size in enumerate(sizes) if num_texts[i] > 1]
+    heapq.heapify(heap)
+    for _ in range(budget - len(sizes)):
+        if not heap:
+            break
+        _, i = heapq.heappop(heap)
+        counts[i] += 1
+        if counts[i] < num_texts[i]:
+            heapq.heappush(heap, (-sizes[i] / counts[i], i))
+    return counts
+
+
+def _append(buffer: bytearray, starts: array, data: bytes):
+    if starts:
+        buffer += SEPARATOR
+    starts.append(len(buffer))
+    buffer += data
+
+
+def _join(data: Iterable[bytes]) -> Tuple[bytearray, array]:
+    buffer, starts = bytearray(), array("Q")
+    for d in data:
+        _append(buffer, starts, d)
+    return buffer, starts
+
+
+# like executor.map, with at most window items submitted and not consumed at a time. items is consumed lazily.
+def _map_bounded(executor: concurrent.futures.Executor, fn: Callable, items: Iterable, window: int) -> Iterator:
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _check_backend(backend: str):
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid backend: {backend}. Valid backends: {BACKENDS}")
+
+
+def _aligned(length: int) -> int:
+    return ceil(length / MODEL_ALIGNMENT) * MODEL_ALIGNMENT
+
+
+def _padding(length: int) -> bytes:
+    return b"\0" * (_aligned(length) - length)
+
+
+def _json_label(label):
+    # numpy labels, eg in 20News
+    if hasattr(label, "item"):
+        label = label.item()
+    if not isinstance(label, (str, int, float, bool)):
+        raise ValueError(f"Label {label} of type {type(label)} can't be saved. Labels must be str, int, float or bool.")
+    return label
+
+
+def _compressor_class(compressor_type: str):
+    module_name, _, class_name = compressor_type.rpartition(".")
+    compressor_class = getattr(importlib.import_module(module_name), class_name, None)
+    if not (isinstance(compressor_class, type) and issubclass(compressor_class, Compressor)):
+        raise ValueError(f"Invalid compressor type in model file: {compressor_type}")
+    return compressor_class
+
+
+# set in each worker process of predict_batch by the pool initializer
+_worker_classifier = None
+
+
+def _init_worker(classifier):
+    global _worker_classifier
+    _worker_classifier = classifier
+
+
+def _call_in_worker(method: str, texts: List[str]):
+    return getattr(_worker_classifier, method)(texts)
+
+
+# set in each worker process of fit by the pool initializer
+_worker_compressor_provider = None
+
+
+def _init_fit_worker(compressor_provider):
+    global _worker_compressor_provider
+    _worker_compressor_provider = compressor_provider
+
+
+def _fit_in_worker(chunk: Tuple[str, bytes, array]) -> Tuple[str, Compressor]:
+    label, buffer, starts = chunk
+    return label, _worker_compressor_provider().fit_buffer(buffer, starts)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from compressors.compressor import Data, SEPARATOR
+from compressors.raw_dictionary_compressor import RawDictionaryCompressor
+
+try:
+    import brotli
+except ImportError:
+    # optional dependency, only needed to use the BrotliCompressor
+    brotli = None
+
+# the dictionary is compressed again with each input: bigger dictionaries make predictions slower.
+# brotli could use a dictionary up to its window size, 4Mb.
+BROTLI_MAX_DICTIONARY_SIZE = 1 << 15
+
+
+# The brotli python package doesn't support custom dictionaries: the dictionary is a prefix of the input.
+# The compressed length of the input is C(dictionary + input) - C(dictionary). At low qualities, this difference
+# is noisy, qualities >= 5 are recommended.
+class BrotliCompressor(RawDictionaryCompressor):
+
+    def __init__(self, size: int = -1, quality=5, seed=0):
+        if brotli is None:
+            raise ImportError("BrotliCompressor requires the brotli package: pip install brotli")
+        super().__init__(size, seed)
+        self.quality = quality
+
+    def max_dictionary_size(self) -> int:
+        return BROTLI_MAX_DICTIONARY_SIZE
+
+    def _prepare(self):
+        self._prefix = self.dictionary + SEPARATOR
+        self._prefix_len = len(brotli.compress(self._prefix, quality=self.quality))
+
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        return len(brotli.compress(self._prefix + data, quality=self.quality)) - self._prefix_len
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "quality": self.quality}
@@ -1,8 +1,13 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Union, Sequence, Iterator
 
 ENCODING = "UTF-8"
+# separator of the texts in a training buffer
+SEPARATOR = b"\n"
+
+# pre-encoded input. memoryview allows zero-copy slices of a shared buffer
+Data = Union[bytes, memoryview]
 
 class Compressor(ABC):
 
@@ -10,10 +15,66 @@ class Compressor(ABC):
     def fit(self, texts: List[str]) -> Compressor:
         raise NotImplementedError()
 
-    @abstractmethod
+    # buffer: texts encoded with ENCODING and joined with SEPARATOR. starts: offset of each text in the buffer.
+    # Lets the classifier train compressors without a Python object per text. Must be equivalent to fit.
+    def fit_buffer(self, buffer: Data, starts: Sequence[int]) -> Compressor:
+        return self.fit([bytes(sample).decode(ENCODING) for sample in split_buffer(buffer, starts)])
+
+    # adds texts to the training data of a fitted compressor, without training again on the previous texts.
+    # Returns the updated compressor. Only compressors that keep their training data as is can implement it.
+    def extend(self, texts: List[str]) -> Compressor:
+        raise NotImplementedError()
+
     def get_compressed_len(self, text: str):
+        return self.get_compressed_len_bytes(text.encode(ENCODING))
+
+    # data must be encoded with ENCODING. Lets callers encode a text once for all compressors.
+    @abstractmethod
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        raise NotImplementedError()
+
+    # size-only scoring of multiple inputs. Implementations can avoid building the compressed output of each input.
+    def get_compressed_lens_bytes(self, data: List[Data]) -> List[int]:
+        return [self.get_compressed_len_bytes(d) for d in data]
+
+    # a dictionary of the content common to all the classes, trained on samples of the texts of all the classes.
+    # size is the maximum size of the shared dictionary, in bytes.
+    def train_shared_dictionary(self, samples: List[bytes], size: int) -> bytes:
+        raise NotImplementedError()
+
+    # whether the compressors fitted with this configuration can be layered on a shared dictionary. Checked before the
+    # training, so that an unsupported configuration fails before the compressors are trained.
+    def supports_shared_dictionary(self) -> bool:
+        return False
+
+    # layers a shared dictionary under the dictionary of a fitted compressor: inputs are compressed with the shared
+    # dictionary followed by the dictionary of the compressor. Returns the updated compressor.
+    # dictionary_size and get_dictionary don't include the shared dictionary: it is counted and saved once per model.
+    # Only compressors that keep their training data as is can implement it.
+    def set_shared_dictionary(self, shared: Data) -> Compressor:
         raise NotImplementedError()
 
     @abstractmethod
     def dictionary_size(self) -> int:
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
+
+    # serialization of a fitted compressor, used to save and load a classifier.
+    # params must be json serializable. The dictionary is written as is in the model file.
+    def get_params(self) -> dict:
+        raise NotImplementedError()
+
+    def get_dictionary(self) -> Data:
+        raise NotImplementedError()
+
+    # dictionary can be a memoryview of a memory-mapped model file
+    @classmethod
+    def from_dictionary(cls, params: dict, dictionary: Data) -> Compressor:
+        raise NotImplementedError()
+
+
+# zero-copy slices of the texts of a training buffer
+def split_buffer(buffer: Data, starts: Sequence[int]) -> Iterator[memoryview]:
+    view = memoryview(buffer)
+    for i, start in enumerate(starts):
+        end = starts[i + 1] - len(SEPARATOR) if i + 1 < len(starts) else len(view)
+        yield view[start:end]
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from compressors.compressor import Data
+from compressors.raw_dictionary_compressor import RawDictionaryCompressor
+
+try:
+    import lz4.block
+except ImportError:
+    # optional dependency, only needed to use the Lz4Compressor
+    lz4 = None
+
+# lz4 window: only the last 64Kb of a dictionary can be referenced
+LZ4_WINDOW = 1 << 16
+
+
+# lz4 block compression with a dictionary. The block doesn't store the uncompressed size.
+# compression_level: 0 is the default fast mode, 1 to 12 are the levels of the high compression mode.
+# The high compression mode loads the dictionary for each input: it is much slower.
+class Lz4Compressor(RawDictionaryCompressor):
+
+    def __init__(self, size: int = -1, compression_level=0, seed=0):
+        if lz4 is None:
+            raise ImportError("Lz4Compressor requires the lz4 package: pip install lz4")
+        super().__init__(size, seed)
+        self.compression_level = compression_level
+
+    def max_dictionary_size(self) -> int:
+        return LZ4_WINDOW
+
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        if self.compression_level > 0:
+            return len(lz4.block.compress(data, mode="high_compression", compression=self.compression_level,
+                                          dict=self.dictionary, store_size=False))
+        return len(lz4.block.compress(data, dict=self.dictionary, store_size=False))
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "compression_level": self.compression_level}
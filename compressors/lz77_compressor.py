@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from typing import Dict, List
+
+from compressors.compressor import Data
+from compressors.raw_dictionary_compressor import RawDictionaryCompressor
+
+MIN_MATCH = 4
+# the dictionary is indexed in a python dict, with an entry per position: bigger dictionaries use a lot of memory
+LZ77_MAX_DICTIONARY_SIZE = 1 << 16
+
+
+# Pure python LZ77, as a readable reference of what the classifier measures, and to run where no codec is available.
+# It is ~100x slower than the C codecs. Only the compressed length is computed, the compressed output is not built.
+# Greedy parsing: at each position, the longest match among the last max_chain occurrences of its first MIN_MATCH
+# bytes, in the input then in the dictionary. The size of a sequence of literals and a match is the one of the lz4
+# format, with offsets on 1 to 3 bytes.
+class Lz77Compressor(RawDictionaryCompressor):
+
+    def __init__(self, size: int = -1, max_chain=8, seed=0):
+        super().__init__(size, seed)
+        self.max_chain = max_chain
+
+    def max_dictionary_size(self) -> int:
+        return LZ77_MAX_DICTIONARY_SIZE
+
+    def _prepare(self):
+        self._index = _index(self.dictionary, range(len(self.dictionary) - MIN_MATCH + 1))
+
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        window = self.dictionary + data
+        start = len(self.dictionary)
+        # positions of the input already parsed
+        input_index = {}
+        size = 0
+        literals = 0
+        position = start
+        while position < len(window):
+            key = window[position:position + MIN_MATCH]
+            best_length, best_offset = 0, 0
+            for index in (input_index, self._index):
+                for candidate in reversed(index.get(key, [])[-self.max_chain:]):
+                    length = _match_length(window, candidate, position)
+                    if length > best_length:
+                        best_length, best_offset = length, position - candidate
+            if best_length < MIN_MATCH:
+                best_length = 1
+                literals += 1
+            else:
+                size += _sequence_size(literals, best_length, best_offset)
+                literals = 0
+            for p in range(position, min(position + best_length, len(window) - MIN_MATCH + 1)):
+                input_index.setdefault(window[p:p + MIN_MATCH], []).append(p)
+            position += best_length
+        # last literals, without match
+        return size + _sequence_size(literals, 0, 0)
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "max_chain": self.max_chain}
+
+
+def _index(data: bytes, positions: range) -> Dict[bytes, List[int]]:
+    index = {}
+    for p in positions:
+        index.setdefault(data[p:p + MIN_MATCH], []).append(p)
+    return index
+
+
+def _match_length(window: bytes, candidate: int, position: int) -> int:
+    length = 0
+    while position + length < len(window) and window[candidate + length] == window[position + length]:
+        length += 1
+    return length
+
+
+# token, literals, offset and length extension bytes of the lz4 format
+def _sequence_size(literals: int, match_length: int, offset: int) -> int:
+    size = 1 + literals + _extension_size(literals)
+    if match_length > 0:
+        size += (offset.bit_length() + 7) // 8 + _extension_size(match_length - MIN_MATCH)
+    return size
+
+
+def _extension_size(length: int) -> int:
+    return 0 if length < 15 else (length - 15) // 255 + 1
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import sys
+from typing import List
+
+import numpy as np
+
+from compressors.compressor import Data
+from compressors.raw_dictionary_compressor import RawDictionaryCompressor
+
+# n-grams are packed in a uint64
+MAX_NGRAM_SIZE = 8
+# multiplicative hashing of the packed n-grams
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+# Surrogate of a compressor: estimates the compressed length without compressing, from the byte n-grams of the input
+# found in the training texts, with numpy lookups only. All the inputs of a batch are scored at once.
+# A match starts at each n-gram found whose previous n-gram is not found. The estimated length is the number of bytes
+# not covered by a found n-gram - literals - plus match_cost per match, like an LZ77 sequence.
+# Repetitions inside the input are not counted: they are the same for all the classes.
+# The index is a bitmap of the hashed n-grams of the training texts, with bits_per_ngram bits per distinct n-gram.
+# Collisions make n-grams found by mistake: more bits per n-gram make less collisions, and a bigger index.
+# The model stores the training texts, the index is built again at load time.
+# size: maximum number of bytes of training texts, sampled. -1 and 0 mean all the texts.
+class NgramCompressor(RawDictionaryCompressor):
+
+    def __init__(self, size: int = -1, n=8, match_cost=3, bits_per_ngram=16, seed=0):
+        if not 1 <= n <= MAX_NGRAM_SIZE:
+            raise ValueError(f"n must be between 1 and {MAX_NGRAM_SIZE}.")
+        super().__init__(size, seed)
+        self.n = n
+        self.match_cost = match_cost
+        self.bits_per_ngram = bits_per_ngram
+
+    # there is no window, all the training texts can be indexed
+    def max_dictionary_size(self) -> int:
+        return sys.maxsize
+
+    def _prepare(self):
+        ngrams = np.unique(_ngrams(np.frombuffer(self.dictionary, dtype=np.uint8), self.n))
+        self._hash_bits = max(int(np.ceil(np.log2(max(len(ngrams), 1) * self.bits_per_ngram))), 3)
+        bitmap = np.zeros(1 << self._hash_bits, dtype=bool)
+        bitmap[self._hash(ngrams)] = True
+        self._index = np.packbits(bitmap, bitorder="little")
+
+    def _hash(self, ngrams: np.ndarray) -> np.ndarray:
+        return (ngrams * HASH_MULTIPLIER) >> np.uint64(64 - self._hash_bits)
+
+    def _found(self, ngrams: np.ndarray) -> np.ndarray:
+        hashes = self._hash(ngrams)
+        return (self._index[hashes >> np.uint64(3)] >> (hashes & np.uint64(7)).astype(np.uint8)) & 1 == 1
+
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        return self.get_compressed_lens_bytes([data])[0]
+
+    def get_compressed_lens_bytes(self, data: List[Data]) -> List[int]:
+        lengths = np.array([len(d) for d in data], dtype=np.int64)
+        buffer = np.frombuffer(b"".join(data), dtype=np.uint8)
+        text_ids = np.repeat(np.arange(len(data)), lengths)
+        ngrams = _ngrams(buffer, self.n)
+        ngram_text_ids = text_ids[:len(ngrams)]
+        # n-grams that start in a text and end in the next one are ignored
+        found = self._found(ngrams) & (np.arange(len(ngrams)) + self.n <= np.cumsum(lengths)[ngram_text_ids])
+
+        # a byte is covered if one of the n n-grams that contain it is found
+        found_before = np.zeros(len(buffer) + 1, dtype=np.int64)
+        np.cumsum(found, out=found_before[1:len(ngrams) + 1])
+        found_before[len(ngrams) + 1:] = found_before[len(ngrams)]
+        positions = np.arange(1, len(buffer) + 1)
+        covered = found_before[positions] - found_before[np.maximum(positions - self.n, 0)] > 0
+        match_starts = found.copy()
+        match_starts[1:] &= ~found[:-1] | (ngram_text_ids[1:] != ngram_text_ids[:-1])
+
+        literals = np.bincount(text_ids, weights=~covered, minlength=len(data))
+        matches = np.bincount(ngram_text_ids, weights=match_starts, minlength=len(data))
+        return (literals + self.match_cost * matches).astype(np.int64).tolist()
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "n": self.n, "match_cost": self.match_cost,
+                "bits_per_ngram": self.bits_per_ngram}
+
+
+# n-gram starting at each position, packed in a uint64 - little endian
+def _ngrams(data: np.ndarray, n: int) -> np.ndarray:
+    count = max(len(data) - n + 1, 0)
+    ngrams = np.zeros(count, dtype=np.uint64)
+    for j in range(n):
+        ngrams |= data[j:j + count].astype(np.uint64) << np.uint64(8 * j)
+    return ngrams
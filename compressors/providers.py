@@ -0,0 +1,27 @@
+from compressors.brotli_compressor import BrotliCompressor
+from compressors.lz4_compressor import Lz4Compressor
+from compressors.lz77_compressor import Lz77Compressor
+from compressors.ngram_compressor import NgramCompressor
+from compressors.zlib_compressor import ZlibCompressor
+from compressors.zstd_compressor import ZstdCompressor
+
+# compressor configurations, by name. A provider takes the dictionary size constraint and returns a new compressor.
+# Codecs other than zstd don't train dictionaries: size is the maximum number of bytes of training texts kept as
+# dictionary, -1 and 0 mean as much as the codec window allows.
+# LZ4 and BROTLI require the optional lz4 and brotli packages.
+COMPRESSOR_PROVIDERS = {
+    "ZSTD_CL15": lambda size: ZstdCompressor(size=size, compression_level=15),
+    "ZSTD_CL12": lambda size: ZstdCompressor(size=size, compression_level=12),
+    "ZSTD_CL10": lambda size: ZstdCompressor(size=size, compression_level=10),
+    "ZSTD_CL9": lambda size: ZstdCompressor(size=size, compression_level=9),
+    "ZSTD_CL6": lambda size: ZstdCompressor(size=size, compression_level=6),
+    "ZSTD_CL3": lambda size: ZstdCompressor(size=size, compression_level=3),
+    "LZ4": lambda size: Lz4Compressor(size=size),
+    "LZ4_HC9": lambda size: Lz4Compressor(size=size, compression_level=9),
+    "BROTLI_Q5": lambda size: BrotliCompressor(size=size, quality=5),
+    "BROTLI_Q9": lambda size: BrotliCompressor(size=size, quality=9),
+    "ZLIB_L9": lambda size: ZlibCompressor(size=size, compression_level=9),
+    "ZLIB_L6": lambda size: ZlibCompressor(size=size, compression_level=6),
+    "LZ77_PY": lambda size: Lz77Compressor(size=size),
+    "NGRAM_8": lambda size: NgramCompressor(size=size, n=8),
+}
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from abc import abstractmethod
+from typing import List, Sequence
+
+from compressors.compressor import Compressor, ENCODING, SEPARATOR, Data, split_buffer
+from sampling import sample
+
+
+# Base class of the compressors that use the training texts as is as dictionary - a preset dictionary or a prefix -,
+# like zstd with size -1. There is no dictionary training.
+# Most codecs only use the last bytes of a dictionary, up to the size of their window. If the training texts are
+# bigger than the dictionary, they are sampled with a reservoir sampler seeded with seed, so that the dictionary
+# represents all the texts, not only the last ones.
+# Attributes prepared from the dictionary by _prepare must start with an underscore: they are not pickled.
+class RawDictionaryCompressor(Compressor):
+
+    # size: maximum size of the dictionary, in bytes. -1 or 0 means the biggest dictionary the codec can use.
+    def __init__(self, size: int = -1, seed=0):
+        if size < -1:
+            raise ValueError("size must be -1, 0 or an integer")
+        self.size = size
+        self.seed = seed
+
+    # the window of the codec: the maximum number of dictionary bytes that can be referenced
+    @abstractmethod
+    def max_dictionary_size(self) -> int:
+        raise NotImplementedError()
+
+    # builds what the codec needs from self.dictionary, eg a compressor primed with the dictionary
+    def _prepare(self):
+        pass
+
+    def fit(self, texts: List[str]) -> RawDictionaryCompressor:
+        return self._fit([text.encode(ENCODING) for text in texts])
+
+    def fit_buffer(self, buffer: Data, starts: Sequence[int]) -> RawDictionaryCompressor:
+        if len(buffer) <= self._budget():
+            return self._set_dictionary(buffer)
+        return self._fit([bytes(text) for text in split_buffer(buffer, starts)])
+
+    def _fit(self, samples: List[bytes]) -> RawDictionaryCompressor:
+        budget = self._budget()
+        dictionary = SEPARATOR.join(sample(samples, budget, self.seed))
+        # the separators are not counted by the sampler
+        return self._set_dictionary(dictionary[-budget:])
+
+    def _budget(self) -> int:
+        return self.max_dictionary_size() if self.size <= 0 else min(self.size, self.max_dictionary_size())
+
+    def _set_dictionary(self, dictionary: Data) -> RawDictionaryCompressor:
+        self.dictionary = bytes(dictionary)
+        self._prepare()
+        return self
+
+    def dictionary_size(self) -> int:
+        return len(self.dictionary)
+
+    def get_params(self) -> dict:
+        return {"size": self.size, "seed": self.seed}
+
+    def get_dictionary(self) -> Data:
+        return self.dictionary
+
+    @classmethod
+    def from_dictionary(cls, params: dict, dictionary: Data) -> RawDictionaryCompressor:
+        return cls(**params)._set_dictionary(dictionary)
+
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items() if not name.startswith("_")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "dictionary" in state:
+            self._prepare()
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import zlib
+
+from compressors.compressor import Data
+from compressors.raw_dictionary_compressor import RawDictionaryCompressor
+
+# deflate window: only the last 32Kb of a preset dictionary can be referenced
+ZLIB_WBITS = 15
+
+
+# deflate with a preset dictionary (zdict). The output is a raw deflate stream, without header and checksum.
+class ZlibCompressor(RawDictionaryCompressor):
+
+    def __init__(self, size: int = -1, compression_level=9, seed=0):
+        super().__init__(size, seed)
+        self.compression_level = compression_level
+
+    def max_dictionary_size(self) -> int:
+        return 1 << ZLIB_WBITS
+
+    # setting the dictionary hashes all its bytes: the primed compressor is copied for each input instead
+    def _prepare(self):
+        self._primed = zlib.compressobj(self.compression_level, zlib.DEFLATED, -ZLIB_WBITS, zdict=self.dictionary)
+
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        compressor = self._primed.copy()
+        return len(compressor.compress(data)) + len(compressor.flush())
+
+    def get_params(self) -> dict:
+        return {**super().get_params(), "compression_level": self.compression_level}
@@ -1,53 +1,187 @@
 from __future__ import annotations
 
-from typing import List
+import threading
+from typing import List, Sequence, Callable
 
 import zstandard
 
-from compressors.compressor import Compressor, ENCODING
+import instrumentation
+from compressors.compressor import Compressor, ENCODING, SEPARATOR, Data, split_buffer
+from sampling import sample
+
+# multi_compress_to_buffer is only available with the C backend of zstandard
+MULTI_COMPRESS = "multi_compress_to_buffer" in zstandard.backend_features
 
 
 class ZstdCompressor(Compressor):
 
-    def __init__(self, size: int = -1, compression_level=9):
+    # sample_budget: if > 0, the samples given to the dictionary training are sampled to sample_budget bytes with a
+    # reservoir sampler seeded with seed. Makes the training of big classes faster.
+    # k, d, steps, threads: parameters of the fastcover dictionary training. 0 means default.
+    # Setting steps or threads changes the parameter search, so the dictionary is different from the default one.
+    # window_log, strategy: compression parameters. 0 means derived from the compression level and the dictionary size,
+    # like zstd does. A smaller window or a faster strategy makes the compression faster, but changes the scores.
+    def __init__(self, size: int = -1, compression_level=9, sample_budget=0, seed=0, k=0, d=0, steps=0, threads=0,
+                 window_log=0, strategy=0):
         self.compression_level = compression_level
         self.size = size
+        self.sample_budget = sample_budget
+        self.seed = seed
+        self.k = k
+        self.d = d
+        self.steps = steps
+        self.threads = threads
+        self.window_log = window_log
+        self.strategy = strategy
+        # number of bytes of the dictionary that belong to the shared dictionary, separator included
+        self.shared_size = 0
 
     def fit(self, data: List[str]) -> ZstdCompressor:
+        return self._fit(lambda: '\n'.join(data).encode(ENCODING), lambda: [e.encode(ENCODING) for e in data])
+
+    # the buffer is already the texts joined with '\n': it is used as is for the raw content dictionary
+    def fit_buffer(self, buffer: Data, starts: Sequence[int]) -> ZstdCompressor:
+        # train_dictionary only accepts bytes samples
+        return self._fit(lambda: buffer, lambda: [bytes(sample) for sample in split_buffer(buffer, starts)])
+
+    # combined_texts and samples are only built if needed
+    def _fit(self, combined_texts: Callable[[], Data], samples: Callable[[], List[bytes]]) -> ZstdCompressor:
         if self.size < -1:
             raise ValueError("size must be -1, 0 or an integer")
         if self.size == -1:
             # -1: special value - the whole dataset is set maintained in memory and set as prefix for compression
-            combined_texts = '\n'.join(data)
-            self.dictionary = zstandard.ZstdCompressionDict(combined_texts.encode(ENCODING),
-                                                            dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+            self._set_dictionary(combined_texts(), zstandard.DICT_TYPE_RAWCONTENT)
         else:
             # 0: special value - the dictionary size is unbounded, but optimized
             # we set unbounded at ~10Gb. Should be enough for the moment
             size_limit = int(1e10) if self.size == 0 else self.size
             try:
-              self.dictionary = zstandard.train_dictionary(size_limit, [e.encode(ENCODING) for e in data], split_point=1,
-                                                         level=self.compression_level)
+              training_samples = samples()
+              if self.sample_budget > 0:
+                  training_samples = sample(training_samples, self.sample_budget, self.seed)
+              start = instrumentation.start()
+              dictionary = zstandard.train_dictionary(size_limit, training_samples, split_point=1,
+                                                      level=self.compression_level, k=self.k, d=self.d,
+                                                      steps=self.steps, threads=self.threads)
+              instrumentation.record("zstd.train_dictionary", start,
+                                     bytes_in=sum(len(sample) for sample in training_samples),
+                                     bytes_out=len(dictionary.as_bytes()))
+              self._set_dictionary(dictionary.as_bytes(), zstandard.DICT_TYPE_FULLDICT)
             except Exception as e:
                 if "Src size is incorrect" in str(e):
                     print("WARNING - Could not train dictionary. Not enough data. Using the whole training data as compressor prefix.")
-                    combined_texts = '\n'.join(data)
-                    self.dictionary = zstandard.ZstdCompressionDict(combined_texts.encode(ENCODING),
-                                                                    dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+                    self._set_dictionary(combined_texts(), zstandard.DICT_TYPE_RAWCONTENT)
                 else:
                     raise e
-        # can be improved for perf - params = zstandard.ZstdCompressionParameters(...)
-        self.dictionary.precompute_compress(level=self.compression_level)
-        self.compressor = zstandard.ZstdCompressor(dict_data=self.dictionary)
 
         return self
 
-    def get_compressed_len(self, text: str):
-        compressed = self.compressor.compress(text.encode(ENCODING))
+    # raw content dictionaries are the training texts joined with '\n': new texts are appended at the end.
+    def extend(self, data: List[str]) -> ZstdCompressor:
+        if self.dict_type != zstandard.DICT_TYPE_RAWCONTENT:
+            raise NotImplementedError("Only dictionaries of size -1 (raw content) can be extended. "
+                                      "Trained dictionaries must be fitted again on all texts.")
+        if data:
+            self._set_dictionary(self.dictionary.as_bytes() + ('\n' + '\n'.join(data)).encode(ENCODING),
+                                 zstandard.DICT_TYPE_RAWCONTENT)
+        return self
+
+    # the shared dictionary is a trained dictionary, used as raw content by set_shared_dictionary: its content is the
+    # segments the most frequent in the samples. The entropy tables at its start are a few hundred unused bytes.
+    def train_shared_dictionary(self, samples: List[bytes], size: int) -> bytes:
+        return zstandard.train_dictionary(size, samples, split_point=1, level=self.compression_level, k=self.k,
+                                          d=self.d, steps=self.steps, threads=self.threads).as_bytes()
+
+    # trained dictionaries have entropy tables and can't be prefixed: only raw content dictionaries can be layered
+    def supports_shared_dictionary(self) -> bool:
+        return self.size == -1
+
+    # the shared dictionary is put before the class texts: zstd prefers the closest matches, ie the class texts.
+    def set_shared_dictionary(self, shared: Data) -> ZstdCompressor:
+        if self.dict_type != zstandard.DICT_TYPE_RAWCONTENT:
+            raise NotImplementedError("Only dictionaries of size -1 (raw content) can be layered on a shared "
+                                      "dictionary.")
+        dictionary_data = bytes(shared) + SEPARATOR + self.get_dictionary()
+        self._set_dictionary(dictionary_data, zstandard.DICT_TYPE_RAWCONTENT)
+        self.shared_size = len(shared) + len(SEPARATOR)
+        return self
+
+    def _set_dictionary(self, dictionary_data: Data, dict_type: int):
+        self.dict_type = dict_type
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary_data, dict_type=dict_type)
+        self.compression_params = self._compression_params(len(self.dictionary.as_bytes()))
+        start = instrumentation.start()
+        self.dictionary.precompute_compress(compression_params=self.compression_params)
+        instrumentation.record("zstd.precompute_compress", start, bytes_in=len(dictionary_data))
+        # a zstandard.ZstdCompressor can't be used by multiple threads at the same time: one instance per thread.
+        # The precomputed dictionary is read-only and shared by all instances.
+        self._local = threading.local()
+
+    # the frame header is the zstd default one: content size and dictionary id, no checksum. The dictionary id is a
+    # per-dictionary bias of up to 4 bytes, and the scores of trained dictionaries change without it: the header is
+    # part of the compressed length, the accuracy tables were measured with it.
+    def _compression_params(self, dict_size: int) -> zstandard.ZstdCompressionParameters:
+        overrides = {name: value for name, value in [("window_log", self.window_log), ("strategy", self.strategy)] if
+                     value}
+        return zstandard.ZstdCompressionParameters.from_level(self.compression_level, dict_size=dict_size,
+                                                              write_checksum=0, write_content_size=1, write_dict_id=1,
+                                                              **overrides)
+
+    # the context of a thread is created once, with the dictionary attached, then reused for all the inputs
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(dict_data=self.dictionary, compression_params=self.compression_params)
+            self._local.compressor = compressor
+        return compressor
+
+    def get_compressed_len_bytes(self, data: Data) -> int:
+        compressed = self._compressor().compress(data)
         return len(compressed)
 
+    def get_compressed_lens_bytes(self, data: List[Data]) -> List[int]:
+        # multi_compress_to_buffer raises on an empty input
+        if not data:
+            return []
+        # for a single input, compress() is faster than building a multi-frame buffer
+        if not MULTI_COMPRESS or len(data) == 1:
+            return super().get_compressed_lens_bytes(data)
+        # all inputs are compressed in a single call into one output buffer - no bytes object is built per input
+        # the frames are the same as with compress(), so the lengths are the same as get_compressed_len_bytes
+        compressed = self._compressor().multi_compress_to_buffer(data)
+        return [len(segment) for segment in compressed]
+
     def dictionary_size(self):
-        return len(self.dictionary.as_bytes())
+        return len(self.dictionary.as_bytes()) - self.shared_size
+
+    def get_params(self) -> dict:
+        return {"size": self.size, "compression_level": self.compression_level, "sample_budget": self.sample_budget,
+                "seed": self.seed, "k": self.k, "d": self.d, "steps": self.steps, "threads": self.threads,
+                "window_log": self.window_log, "strategy": self.strategy, "dict_type": self.dict_type}
+
+    def get_dictionary(self) -> Data:
+        return memoryview(self.dictionary.as_bytes())[self.shared_size:]
+
+    @classmethod
+    def from_dictionary(cls, params: dict, dictionary: Data) -> ZstdCompressor:
+        compressor = cls(**{name: value for name, value in params.items() if name != "dict_type"})
+        compressor._set_dictionary(dictionary, params["dict_type"])
+        return compressor
+
+    # zstandard objects can't be pickled. Only the dictionary bytes are sent, eg to worker processes.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_local", None)
+        state.pop("compression_params", None)
+        if "dictionary" in state:
+            state["dictionary"] = self.dictionary.as_bytes()
+        return state
+
+    def __setstate__(self, state):
+        dictionary_data = state.pop("dictionary", None)
+        self.__dict__.update(state)
+        if dictionary_data is not None:
+            self._set_dictionary(dictionary_data, self.dict_type)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+from array import array
+from typing import Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from compressors.compressor import ENCODING, SEPARATOR
+from datastore import StoredSplit
+
+# texts are copied in blocks of about this many bytes when a corpus is grouped or built from a stored split: the
+# positions of the bytes of a block are computed at once, with 16 bytes of temporary indexes per byte of the block.
+GROUP_BLOCK_SIZE = 1 << 18
+
+Pairs = Iterable[Tuple[object, str]]
+
+
+# A training corpus stored in arrays: the texts encoded with ENCODING, each followed by SEPARATOR, in one buffer, the
+# offsets of the texts in the buffer (uint64, one more than the texts) and the label code of each text (int32, index of
+# the label in labels). A text costs 12 bytes of arrays, instead of the tuple, str and list entry of a list of pairs:
+# millions of texts don't make millions of Python objects for the garbage collector to track.
+# Once grouped, the texts of each class are contiguous: the training buffer of a class is a slice of the corpus buffer.
+class Corpus:
+
+    def __init__(self, labels: List, codes: np.ndarray, offsets: np.ndarray, buffer: Union[bytearray, np.ndarray]):
+        self.labels = labels
+        self.codes = codes
+        self.offsets = offsets
+        self.buffer = buffer
+
+    # pairs is consumed once: it can be an iterator
+    @classmethod
+    def from_pairs(cls, pairs: Pairs) -> "Corpus":
+        labels = {}
+        codes = array("i")
+        offsets = array("Q", [0])
+        buffer = bytearray()
+        for label, text in pairs:
+            codes.append(labels.setdefault(label, len(labels)))
+            buffer += text.encode(ENCODING)
+            buffer += SEPARATOR
+            offsets.append(len(buffer))
+        return cls(list(labels), np.frombuffer(codes, dtype=np.int32), np.frombuffer(offsets, dtype=np.uint64), buffer)
+
+    # the texts of a stored split are not decoded: they are copied with their separators in one pass over the blob.
+    # With grouped=True, they are grouped in the same pass: one copy instead of two.
+    @classmethod
+    def from_split(cls, split: StoredSplit, grouped=False) -> "Corpus":
+        order = np.argsort(split.codes, kind="stable") if grouped else np.arange(len(split))
+        buffer, offsets = _gather(np.frombuffer(split.blob, dtype=np.uint8), split.offsets, order, separated=False)
+        return cls(list(split.labels), split.codes[order], offsets, buffer)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    # encoded texts, as zero-copy views of the buffer without their separator, in the order of the corpus
+    def data(self) -> Iterator[memoryview]:
+        view = memoryview(self.buffer)
+        offsets = self.offsets.tolist()
+        for i in range(len(self)):
+            yield view[offsets[i]:offsets[i + 1] - len(SEPARATOR)]
+
+    # the texts sorted by label code, with a stable argsort: texts of a class stay in the order of the corpus.
+    # Returns the corpus itself if it is already grouped, else a copy.
+    def grouped(self) -> "Corpus":
+        if np.all(self.codes[:-1] <= self.codes[1:]):
+            return self
+        order = np.argsort(self.codes, kind="stable")
+        buffer, offsets = _gather(np.frombuffer(self.buffer, dtype=np.uint8), self.offsets, order, separated=True)
+        return Corpus(self.labels, self.codes[order], offsets, buffer)
+
+    # for each label with texts, in the order of the labels: the texts of the label joined with SEPARATOR, a zero-copy
+    # view of the buffer, and the offset of each text in the view. The corpus must be grouped.
+    def classes(self) -> Iterator[Tuple[object, memoryview, np.ndarray]]:
+        view = memoryview(self.buffer)
+        bounds = np.zeros(len(self.labels) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.codes, minlength=len(self.labels)), out=bounds[1:])
+        for code, label in enumerate(self.labels):
+            begin, end = bounds[code], bounds[code + 1]
+            if begin == end:
+                continue
+            starts = self.offsets[begin:end] - self.offsets[begin]
+            yield label, view[int(self.offsets[begin]):int(self.offsets[end]) - len(SEPARATOR)], starts
+
+
+# a corpus from pairs, a stored split or a corpus
+def as_corpus(pairs: Union[Corpus, StoredSplit, Pairs], grouped=False) -> Corpus:
+    if isinstance(pairs, StoredSplit):
+        return Corpus.from_split(pairs, grouped)
+    corpus = pairs if isinstance(pairs, Corpus) else Corpus.from_pairs(pairs)
+    return corpus.grouped() if grouped else corpus
+
+
+# copies the texts of source delimited by offsets to a new buffer, in the given order, each followed by SEPARATOR.
+# separated: whether the texts are followed by SEPARATOR in source. Returns the buffer and the offsets of the texts.
+# No Python object per text: the destination of each byte of a block of texts is computed with numpy.
+def _gather(source: np.ndarray, offsets: np.ndarray, order: np.ndarray, separated: bool) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    # the separators are written as one byte per text in the buffer
+    assert len(SEPARATOR) == 1, "_gather only supports a SEPARATOR of one byte"
+    offsets = offsets.astype(np.int64)
+    lengths = np.diff(offsets)
+    added = 0 if separated else len(SEPARATOR)
+    gathered_offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(lengths[order] + added, out=gathered_offsets[1:])
+    # distance from the position of each text in source to its position in the buffer
+    shifts = np.empty(len(order), dtype=np.int64)
+    shifts[order] = gathered_offsets[:-1] - offsets[:-1][order]
+
+    buffer = np.empty(gathered_offsets[-1], dtype=np.uint8)
+    if not separated:
+        buffer[gathered_offsets[1:] - len(SEPARATOR)] = SEPARATOR[0]
+    block_starts = np.unique(np.searchsorted(offsets, np.arange(0, offsets[-1], GROUP_BLOCK_SIZE), side="right") - 1)
+    for begin, end in zip(block_starts, np.append(block_starts[1:], len(order))):
+        positions = np.arange(offsets[begin], offsets[end])
+        buffer[positions + np.repeat(shifts[begin:end], lengths[begin:end])] = source[positions]
+    return buffer, gathered_offsets.astype(np.uint64)
@@ -2,14 +2,22 @@
 # LICENSE unknown
 
 import csv
+import itertools
 import os
 import random
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, TextIO, Tuple
 
 import numpy as np
-import unidecode
-from datasets import load_dataset
-from sklearn.datasets import fetch_20newsgroups
+
+# unidecode, datasets (HuggingFace) and sklearn are imported by the loaders that use them: importing them takes
+# seconds and hundreds of MB, and most loaders and the inference don't need them.
+
+# number of threads reading the files of directory-based datasets. Reading small files is dominated by the open and
+# read system calls, that release the GIL. With one CPU, the files are read sequentially: the thread pool only adds
+# overhead.
+READ_THREADS = min(8, os.cpu_count() or 1)
 
 
 def _load_csv_filepath(csv_filepath: str) -> list:
@@ -82,6 +90,8 @@ def read_fn_compress(fn: str) -> list:
         list: Compressed file contents line separated.
     """
 
+    import unidecode
+
     text = unidecode.unidecode(open(fn).read())
     text_list = text.strip().split("\n")
     return text_list
@@ -136,6 +146,8 @@ def load_20news(categories=None):
             pairs.append((label, text))
         return pairs
 
+    from sklearn.datasets import fetch_20newsgroups
+
     newsgroups_train = fetch_20newsgroups(subset="train", categories=categories)
     newsgroups_test = fetch_20newsgroups(subset="test", categories=categories)
     train_ds, test_ds = process(newsgroups_train), process(newsgroups_test)
@@ -156,26 +168,47 @@ def load_ohsumed_single_23(data_directory: str) -> tuple:
         tuple: Pair of training and testing datasets.
     """
 
-    def process(data_directory: str) -> list:
-        dataset = []
+    train_dir = os.path.join(data_directory, "training")
+    test_dir = os.path.join(data_directory, "test")
+    train_ds, test_ds = list(iter_label_directories(train_dir)), list(iter_label_directories(test_dir))
+    return train_ds, test_ds
+
+
+def iter_label_directories(data_directory: str, threads: int = READ_THREADS) -> Iterator[Tuple[str, str]]:
+    """
+    Yields the texts of a dataset stored as one subdirectory per label,
+    with one file per text, eg Ohsumed. The files of a subdirectory are
+    read in parallel with `threads` threads, then yielded in the order
+    of `os.listdir`.
+
+    Arguments:
+        data_directory (str): Directory containing one subdirectory per label.
+        threads (int): Number of threads reading the files. 1 reads them
+            sequentially, without thread pool.
+
+    Returns:
+        Iterator[Tuple[str, str]]: (label, text) pairs. Texts are stripped.
+    """
 
-        # TODO: Replace with `glob` to crawl files into a list.
+    executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
         for directory_name in os.listdir(data_directory):
             subdirectory_path = os.path.join(data_directory, directory_name)
             if os.path.isdir(subdirectory_path):
-                label = directory_name
-                for filename in os.listdir(subdirectory_path):
-                    filepath = os.path.join(subdirectory_path, filename)
+                filepaths = [os.path.join(subdirectory_path, filename) for filename in os.listdir(subdirectory_path)]
+                filepaths = [filepath for filepath in filepaths if os.path.isfile(filepath)]
+                # only the texts of one subdirectory are in memory at a time
+                texts = executor.map(_read_stripped, filepaths) if executor else map(_read_stripped, filepaths)
+                for text in texts:
+                    yield directory_name, text
+    finally:
+        if executor:
+            executor.shutdown()
 
-                    if os.path.isfile(filepath):
-                        text = open(filepath).read().strip()
-                        dataset.append((label, text))
-        return dataset
 
-    train_dir = os.path.join(data_directory, "training")
-    test_dir = os.path.join(data_directory, "test")
-    train_ds, test_ds = process(train_dir), process(test_dir)
-    return train_ds, test_ds
+def _read_stripped(filepath: str) -> str:
+    with open(filepath) as f:
+        return f.read().strip()
 
 
 def load_ohsumed(data_directory: str, split: float = 0.9) -> tuple:
@@ -222,20 +255,86 @@ def load_reuters(data_directory: str, delimiter: str = "\t") -> tuple:
         tuple: Tuple of lists containing the training and testing datasets respectively.
     """
 
-    def process(filename: str) -> list:
-        processed_data = []
-        text_list = open(filename, "r").read().strip().split("\n")
-        for row in text_list:
-            label, text = row.split(delimiter)
-            processed_data.append((label, text))
-        return processed_data
-
     test_fn = os.path.join(data_directory, "test.txt")
     train_fn = os.path.join(data_directory, "train.txt")
-    train_ds, test_ds = process(train_fn), process(test_fn)
+    train_ds, test_ds = list(iter_reuters(train_fn, delimiter)), list(iter_reuters(test_fn, delimiter))
     return train_ds, test_ds
 
 
+def iter_reuters(filename: str, delimiter: str = "\t") -> Iterator[Tuple[str, str]]:
+    """
+    Yields the rows of a R8 or R52 file, one line at a time: the file is
+    not read in memory.
+
+    Arguments:
+        filename (str): File with one `label<delimiter>text` row per line.
+        delimiter (str): File delimiter to parse on.
+
+    Returns:
+        Iterator[Tuple[str, str]]: (label, text) pairs.
+    """
+
+    with open(filename, "r") as f:
+        for row in _stripped_lines(f):
+            label, text = row.split(delimiter)
+            yield label, text
+
+
+def _stripped_lines(f: TextIO) -> Iterator[str]:
+    """
+    Yields the same lines as `f.read().strip().split("\n")`, without
+    reading the whole file: whitespace at the start of the file and at
+    the end of the file is removed.
+
+    Arguments:
+        f (TextIO): File opened in text mode.
+
+    Returns:
+        Iterator[str]: Lines, without the line separator.
+    """
+
+    # the last line with content is yielded when the next line with content is read, with the blank lines in between
+    last = None
+    blank_lines = []
+    for line in f:
+        if line.endswith("\n"):
+            line = line[:-1]
+        if not line.strip():
+            if last is not None:
+                blank_lines.append(line)
+            continue
+        if last is None:
+            line = line.lstrip()
+        else:
+            yield last
+            yield from blank_lines
+            blank_lines = []
+        last = line
+    if last is not None:
+        yield last.rstrip()
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Splits an iterable in lists of `size` items, eg to predict a stream
+    of texts with `predict_batch`, without loading the whole stream.
+
+    Arguments:
+        iterable (Iterable): Items, eg (label, text) pairs of a loader.
+        size (int): Number of items per chunk. The last chunk can be smaller.
+
+    Returns:
+        Iterator[List]: Chunks of items, in order.
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def load_trec(data_directory: str) -> tuple:
     """
     Loads the TREC dataset from a directory.
@@ -287,6 +386,8 @@ def load_kinnews_kirnews(
             pairs.append((label, title + " " + content))
         return pairs
 
+    from datasets import load_dataset
+
     ds = load_dataset(dataset_name, data_split)
     train_ds, test_ds = process(ds["train"]), process(ds["test"])
     return train_ds, test_ds
@@ -308,6 +409,8 @@ def load_swahili() -> tuple:
             pairs.append((label, text))
         return pairs
 
+    from datasets import load_dataset
+
     ds = load_dataset("swahili_news")
     train_ds, test_ds = process(ds["train"]), process(ds["test"])
     return train_ds, test_ds
@@ -337,6 +440,8 @@ def load_filipino():
         return pairs
 
     # FIXME hugging face dataset is incorrect
+    from datasets import load_dataset
+
     ds = load_dataset("dengue_filipino")
     train_ds, test_ds = process(ds["train"]), process(ds["test"])
     return train_ds, test_ds
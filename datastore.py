@@ -0,0 +1,153 @@
+import json
+import mmap
+import os
+import struct
+from math import ceil
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from compressors.compressor import ENCODING
+
+# dataset file format: preamble (magic, version, header length), json header, then the columns of each split.
+# Columns of a split: offsets of the texts in the blob (uint64, one more than the texts), label codes (int32, index of
+# the label in the labels of the header) and the blob of the texts encoded with ENCODING.
+# The header indexes each column by its offset from the start of the columns section.
+DATASET_MAGIC = b"FTDS"
+DATASET_FORMAT_VERSION = 1
+DATASET_PREAMBLE = struct.Struct("<4sIQ")
+DATASET_ALIGNMENT = 8
+SPLITS = ["train", "test"]
+
+Pairs = Iterable[Tuple[object, str]]
+
+
+# A split of a dataset stored in columns, read from a memory-mapped dataset file.
+# Behaves like the list of (label, text) pairs returned by the loaders: texts are decoded when they are accessed.
+class StoredSplit(Sequence):
+
+    def __init__(self, labels: List, codes: np.ndarray, offsets: np.ndarray, blob: memoryview):
+        self.labels = labels
+        self.codes = codes
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("StoredSplit index out of range")
+        return self.labels[self.codes[index]], self.text(index)
+
+    def __iter__(self) -> Iterator[Tuple[object, str]]:
+        labels = [self.labels[code] for code in self.codes.tolist()]
+        offsets = self.offsets.tolist()
+        for i, label in enumerate(labels):
+            yield label, str(self.blob[offsets[i]:offsets[i + 1]], ENCODING)
+
+    def text(self, index: int) -> str:
+        return str(self.blob[self.offsets[index]:self.offsets[index + 1]], ENCODING)
+
+    # encoded texts, as zero-copy views of the blob, in order
+    def data(self) -> Iterator[memoryview]:
+        offsets = self.offsets.tolist()
+        for i in range(len(self)):
+            yield self.blob[offsets[i]:offsets[i + 1]]
+
+
+# Loads a dataset from its cached copy in cache_dir. The first time, the dataset is loaded with loader and written to
+# the cache. The cached copy is keyed by name and version: change the version when the loader or the data change.
+# The dataset file is memory-mapped: only the columns are read at load time, texts are read from the page cache.
+def load_cached(name: str, loader: Callable[[], Tuple[Pairs, Pairs]], cache_dir: str, version=1) \
+        -> Tuple[StoredSplit, StoredSplit]:
+    path = os.path.join(cache_dir, f"{name}.v{version}.ftds")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        write_dataset(path, *loader())
+    return read_dataset(path)
+
+
+# train and test are iterables of (label, text) pairs. Labels must be str, int, float or bool.
+# The file is written next to its final path, then renamed: an interrupted write doesn't leave a broken file.
+def write_dataset(path: str, train: Pairs, test: Pairs):
+    labels = {}
+    splits = []
+    for pairs in (train, test):
+        codes = []
+        offsets = [0]
+        blob = bytearray()
+        for label, text in pairs:
+            label = _json_label(label)
+            codes.append(labels.setdefault(label, len(labels)))
+            blob += text.encode(ENCODING)
+            offsets.append(len(blob))
+        splits.append((np.array(offsets, dtype=np.uint64), np.array(codes, dtype=np.int32), blob))
+
+    header_splits = {}
+    columns = []
+    offset = 0
+    for split_name, (offsets, codes, blob) in zip(SPLITS, splits):
+        entry = {"count": len(codes)}
+        for column_name, column in [("offsets", offsets), ("codes", codes), ("texts", blob)]:
+            column = memoryview(column).cast("B")
+            entry[column_name] = {"offset": offset, "length": len(column)}
+            columns.append(column)
+            offset += _aligned(len(column))
+        header_splits[split_name] = entry
+    header = json.dumps({"labels": list(labels), "splits": header_splits}).encode(ENCODING)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(DATASET_PREAMBLE.pack(DATASET_MAGIC, DATASET_FORMAT_VERSION, len(header)))
+        f.write(header)
+        f.write(_padding(DATASET_PREAMBLE.size + len(header)))
+        for column in columns:
+            f.write(column)
+            f.write(_padding(len(column)))
+    os.replace(temporary_path, path)
+
+
+def read_dataset(path: str) -> Tuple[StoredSplit, StoredSplit]:
+    with open(path, "rb") as f:
+        # the mapping stays valid after the file is closed. It is unmapped when the splits are garbage collected.
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, header_len = DATASET_PREAMBLE.unpack_from(mm)
+    if magic != DATASET_MAGIC:
+        raise ValueError(f"Invalid dataset file: {path}.")
+    if version != DATASET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset file version: {version}. Supported version: {DATASET_FORMAT_VERSION}")
+    header = json.loads(mm[DATASET_PREAMBLE.size:DATASET_PREAMBLE.size + header_len].decode(ENCODING))
+    start = _aligned(DATASET_PREAMBLE.size + header_len)
+    view = memoryview(mm)
+
+    def column(entry: dict) -> memoryview:
+        return view[start + entry["offset"]:start + entry["offset"] + entry["length"]]
+
+    splits = []
+    for split_name in SPLITS:
+        entry = header["splits"][split_name]
+        splits.append(StoredSplit(header["labels"], np.frombuffer(column(entry["codes"]), dtype=np.int32),
+                                  np.frombuffer(column(entry["offsets"]), dtype=np.uint64), column(entry["texts"])))
+    return splits[0], splits[1]
+
+
+def _aligned(length: int) -> int:
+    return ceil(length / DATASET_ALIGNMENT) * DATASET_ALIGNMENT
+
+
+def _padding(length: int) -> bytes:
+    return b"\0" * (_aligned(length) - length)
+
+
+def _json_label(label):
+    # numpy labels, eg in 20News
+    if hasattr(label, "item"):
+        label = label.item()
+    if not isinstance(label, (str, int, float, bool)):
+        raise ValueError(f"Label {label} of type {type(label)} can't be stored. Labels must be str, int, float or bool.")
+    return label
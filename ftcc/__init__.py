@@ -0,0 +1,17 @@
+# Inference entry point: load a saved model and predict, without the dependencies of the experiments - torchtext,
+# datasets, sklearn, the optional codecs. Only numpy is imported. The codec of the compressors of a model, eg zstandard,
+# is imported when the model is loaded.
+#   from ftcc import CompressorClassifier
+#   classifier = CompressorClassifier.load("model.ftcc")
+from cache import PredictionCache
+from compressorclassifier import CompressorClassifier, load_header
+
+__all__ = ["CompressorClassifier", "PredictionCache", "ShardedCompressorClassifier", "load_header"]
+
+
+# the sharded classifier imports the process pool: it is only imported when it is used
+def __getattr__(name):
+    if name == "ShardedCompressorClassifier":
+        from shardedclassifier import ShardedCompressorClassifier
+        return ShardedCompressorClassifier
+    raise AttributeError(f"module {__name__} has no attribute {name}")
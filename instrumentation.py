@@ -0,0 +1,138 @@
+# Opt-in counters of the hot paths of the classifier and the compressors. A counter has a name, eg "predict.score", and
+# labels, eg the class of a compressor. It counts calls, cumulative time in nanoseconds, bytes in and bytes out.
+# Disabled by default: nothing is recorded until enable() is called.
+# Recording is lock-free: each thread increments its own counters, they are summed when they are read. The counters of
+# a thread are folded in a total when the thread exits.
+# Counters are per process: what runs in the worker processes of the process backend is not counted.
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+# name and sorted labels of a counter
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+FIELDS = ["calls", "ns", "bytes_in", "bytes_out"]
+PROMETHEUS_HELP = {
+    "calls": "Number of calls.",
+    "ns": "Cumulative time in nanoseconds.",
+    "bytes_in": "Cumulative number of bytes processed.",
+    "bytes_out": "Cumulative number of bytes produced, eg compressed bytes.",
+}
+
+
+class Instrumentation:
+
+    def __init__(self):
+        self._local = threading.local()
+        # only taken when a thread records its first counter, when a thread exits, and when counters are read
+        self._lock = threading.Lock()
+        # counters of the running threads, by id of their _ThreadCounters
+        self._thread_counters: Dict[int, Dict[Key, List[int]]] = {}
+        # counters of the threads that exited: eg the threads of the pools of predict_batch, created for each batch
+        self._exited_counters: Dict[Key, List[int]] = {}
+
+    def add(self, name: str, ns: int, calls=1, bytes_in=0, bytes_out=0, **labels):
+        thread_counters = getattr(self._local, "counters", None)
+        if thread_counters is None:
+            thread_counters = self._local.counters = _ThreadCounters()
+            with self._lock:
+                self._thread_counters[id(thread_counters)] = thread_counters.counters
+            # the thread local data is released when the thread exits
+            weakref.finalize(thread_counters, self._fold, id(thread_counters))
+        counters = thread_counters.counters
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = [0, 0, 0, 0]
+        counter[0] += calls
+        counter[1] += ns
+        counter[2] += bytes_in
+        counter[3] += bytes_out
+
+    # the counters of an exited thread are added to the counters of the exited threads
+    def _fold(self, thread_id: int):
+        with self._lock:
+            counters = self._thread_counters.pop(thread_id, None)
+            if counters:
+                _add_counters(self._exited_counters, counters)
+
+    # the counters of all threads, summed, sorted by name and labels
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            thread_counters = list(self._thread_counters.values())
+            totals = {key: list(counter) for key, counter in self._exited_counters.items()}
+        for counters in thread_counters:
+            _add_counters(totals, counters)
+        return [{"name": name, "labels": dict(labels), **dict(zip(FIELDS, total))} for (name, labels), total in
+                sorted(totals.items())]
+
+    # Prometheus text exposition format: one counter per field, the name of the counter is the "op" label
+    def prometheus(self, prefix="ftcc") -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for field in FIELDS:
+            metric = f"{prefix}_{field}_total"
+            lines.append(f"# HELP {metric} {PROMETHEUS_HELP[field]}")
+            lines.append(f"# TYPE {metric} counter")
+            for entry in snapshot:
+                labels = ",".join(f'{label}="{_escape(value)}"' for label, value in
+                                  [("op", entry["name"])] + list(entry["labels"].items()))
+                lines.append(f"{metric}{{{labels}}} {entry[field]}")
+        return "\n".join(lines) + "\n"
+
+    # counters of the threads that are still recording are emptied, not removed
+    def reset(self):
+        with self._lock:
+            for counters in self._thread_counters.values():
+                counters.clear()
+            self._exited_counters.clear()
+
+
+# counters of a thread, in its thread local data. Can be weakly referenced, unlike a dict: the counters are folded when
+# it is released, at the exit of the thread.
+class _ThreadCounters:
+    __slots__ = ("counters", "__weakref__")
+
+    def __init__(self):
+        self.counters: Dict[Key, List[int]] = {}
+
+
+def _add_counters(totals: Dict[Key, List[int]], counters: Dict[Key, List[int]]):
+    for key, counter in list(counters.items()):
+        total = totals.setdefault(key, [0, 0, 0, 0])
+        for i, value in enumerate(counter):
+            total[i] += value
+
+
+_active: Optional[Instrumentation] = None
+
+
+# starts recording. Returns the instrumentation, to read the counters.
+def enable() -> Instrumentation:
+    global _active
+    if _active is None:
+        _active = Instrumentation()
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active() -> Optional[Instrumentation]:
+    return _active
+
+
+# timestamp to pass to record. 0 when the instrumentation is disabled, so that the clock is not read.
+def start() -> int:
+    return time.perf_counter_ns() if _active is not None else 0
+
+
+def record(name: str, start_ns: int, calls=1, bytes_in=0, bytes_out=0, **labels):
+    if _active is not None and start_ns:
+        _active.add(name, time.perf_counter_ns() - start_ns, calls, bytes_in, bytes_out, **labels)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -1,14 +1,22 @@
+import cProfile
+import itertools
+import json
 import os
+import pstats
 import time
 import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, List
 
 import click
 import numpy as np
 from py_markdown_table.markdown_table import markdown_table
-from torchtext.datasets import AG_NEWS, IMDB, AmazonReviewPolarity, DBpedia, SogouNews, YahooAnswers, YelpReviewPolarity
 
-from compressorclassifier import CompressorClassifier
-from compressors.zstd_compressor import ZstdCompressor
+import instrumentation
+from aggregation import AGGREGATIONS
+from compressorclassifier import CompressorClassifier, BACKENDS
+from compressors.providers import COMPRESSOR_PROVIDERS
+from datastore import load_cached
 from data import load_20news, load_ohsumed_single_23, load_reuters, load_kinnews_kirnews
 
 def write_csv(filename, data):
@@ -19,17 +27,33 @@ def write_csv(filename, data):
         writer.writerows(data)
 
 DATA_DIR = "data"
+# columnar copies of the datasets, see datastore.load_cached
+DATASET_CACHE_DIR = os.path.join(DATA_DIR, "cache")
+# version of the cached copy of each dataset. Increase it when the loader of a dataset changes.
+DATASET_VERSIONS = {}
+# number of functions printed after a profiled run, and of counters of each name printed after a cell, eg compressors
+PROFILE_PRINTED_FUNCTIONS = 30
+INSTRUMENTATION_PRINTED_COUNTERS = 10
+
+
+# torchtext is imported when one of its datasets is loaded: it imports torch, which takes seconds and hundreds of MB
+def torchtext_loader(dataset_name: str):
+    def load():
+        import torchtext.datasets
+        return getattr(torchtext.datasets, dataset_name)(root=DATA_DIR)
+    return load
+
 
 DATASET_TO_LOADER = {
-    "AG_NEWS": lambda: AG_NEWS(root=DATA_DIR),
-    "IMDB": lambda: IMDB(root=DATA_DIR),
+    "AG_NEWS": torchtext_loader("AG_NEWS"),
+    "IMDB": torchtext_loader("IMDB"),
     # for google drive links, you may have to comment line 22 to line 31 in torchtext._download_hooks.py
-    "AmazonReviewPolarity": lambda: AmazonReviewPolarity(root=DATA_DIR),
-    "DBpedia": lambda: DBpedia(root=DATA_DIR),
+    "AmazonReviewPolarity": torchtext_loader("AmazonReviewPolarity"),
+    "DBpedia": torchtext_loader("DBpedia"),
     # FIXME CYRIL - loading is broken
-    # "SogouNews": lambda: SogouNews(root=DATA_DIR),
-    "YahooAnswers": lambda: YahooAnswers(root=DATA_DIR),
-    "YelpReviewPolarity": lambda: YelpReviewPolarity(root=DATA_DIR),
+    # "SogouNews": torchtext_loader("SogouNews"),
+    "YahooAnswers": torchtext_loader("YahooAnswers"),
+    "YelpReviewPolarity": torchtext_loader("YelpReviewPolarity"),
     # on mac OS, you may have to run something like: ln -s /etc/ssl/* /Library/Frameworks/Python.framework/Versions/3.7/etc/openssl
     # to fix urllib.error.URLError: <urlopen error [SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed: unable to get local issuer certificate (_ssl.c:1091)>
     "20News": load_20news,
@@ -48,15 +72,6 @@ DATASET_TO_LOADER = {
     # "filipino": load_filipino,
 }
 
-COMPRESSOR_PROVIDERS = {
-    "ZSTD_CL15": lambda size: ZstdCompressor(size=size, compression_level=15),
-    "ZSTD_CL12": lambda size: ZstdCompressor(size=size, compression_level=12),
-    "ZSTD_CL10": lambda size: ZstdCompressor(size=size, compression_level=10),
-    "ZSTD_CL9": lambda size: ZstdCompressor(size=size, compression_level=9),
-    "ZSTD_CL6": lambda size: ZstdCompressor(size=size, compression_level=6),
-    "ZSTD_CL3": lambda size: ZstdCompressor(size=size, compression_level=3)
-}
-
 
 @click.command()
 @click.option("-d", "--dataset", help='Dataset', type=click.Choice(list(DATASET_TO_LOADER.keys())), multiple=True,
@@ -74,68 +89,127 @@ COMPRESSOR_PROVIDERS = {
               multiple=True,
               default=[1, 3, 5])
 @click.option("-s", "--size",
-              help="Constraint on the size of the created dictionaries, in bytes. Each generated dictionary will have a size smaller or equal to this value. Special value -1 means the whole training dataset is maintained in memory. Special value 0 means the size of the dictionary is unbounded, but optimized.",
+              help="Constraint on the size of the created dictionaries, in bytes. Each generated dictionary will have a size smaller or equal to this value. Special value -1 means the whole training dataset is maintained in memory. Special value 0 means the size of the dictionary is unbounded, but optimized. For codecs other than zstd, the maximum size of the training texts kept as dictionary, -1 and 0 mean as much as the codec window allows.",
               multiple=True,
               default=[-1])
-def run_experiment(dataset, compressor, top_k_accuracy, compressors_per_class, size):
+@click.option("-w", "--workers",
+              help="Number of workers used for the training and the evaluation. With more than 1 worker, compressors are trained in parallel, and test observations are predicted in batch: the prediction time is the average time per observation.",
+              type=int,
+              default=1)
+@click.option("-b", "--backend",
+              help="Parallel execution backend used for the training and the evaluation when workers > 1.",
+              type=click.Choice(BACKENDS),
+              default="thread")
+@click.option("-cp", "--cascade_prefix",
+              help="Cascaded prediction: number of bytes of the input used to prune classes before the full scoring. 0 means no cascade: the input is scored against all classes. Compare 0 with other values to get the accuracy/latency trade-off.",
+              multiple=True,
+              default=[0])
+@click.option("-ck", "--cascade_keep",
+              help="Cascaded prediction: fraction of the classes kept for the full scoring.",
+              type=float,
+              default=0.2)
+@click.option("-sb", "--sample_budget",
+              help="Maximum number of bytes of training texts per class, sampled with a seeded reservoir sampler. 0 means all texts are used. Compare several values to get the training time/accuracy trade-off.",
+              multiple=True,
+              default=[0])
+@click.option("-ag", "--aggregation",
+              help="How the scores of the compressors of a class are reduced to one score when CPC > 1.",
+              type=click.Choice(list(AGGREGATIONS.keys())), multiple=True,
+              default=["sum"])
+@click.option("-sd", "--shared_dictionary_size",
+              help="Size in bytes of a dictionary trained on all classes and layered under the dictionary of each class. 0 means no shared dictionary. Only for compressors with size -1.",
+              type=int, multiple=True,
+              default=[0])
+@click.option("-cb", "--compressor_budget",
+              help="Total number of compressors. Each class gets a number of compressors that depends on its size, CPC is ignored. 0 means CPC compressors per class. Requires the mean or min aggregation.",
+              type=int, multiple=True,
+              default=[0])
+@click.option("--dataset_cache/--no_dataset_cache",
+              help=f"Load the datasets from a columnar copy in {DATASET_CACHE_DIR}, created at the first load. Delete the folder to load the datasets again.",
+              default=True)
+@click.option("-j", "--jobs",
+              help="Number of cells of the grid - a configuration on a dataset - run in parallel, in separate processes. With more than 1 job, cells compete for the CPU: use 1 job to measure speed.",
+              type=int,
+              default=1)
+@click.option("-r", "--results_file",
+              help="JSON lines file where the result of each cell is appended when the cell is done. Cells already in the file are not run again: an interrupted run can be resumed. Delete the file to run all the cells again.",
+              default="experiment_results.jsonl")
+@click.option("--profile", "profile_path",
+              help="Run the cells with cProfile and write the stats to this file, eg profile.prof. Read them with python -m pstats. Requires 1 job.",
+              default=None)
+@click.option("--instrument",
+              help="Count the calls, time and bytes of the phases of the training and the prediction, and of each compressor. The counters are printed after each cell.",
+              is_flag=True)
+def run_experiment(dataset, compressor, top_k_accuracy, compressors_per_class, size, workers, backend, cascade_prefix,
+                   cascade_keep, sample_budget, aggregation, shared_dictionary_size, compressor_budget, dataset_cache,
+                   jobs, results_file, profile_path, instrument):
     # convert k to int - see click issue https://github.com/pallets/click/issues/784
     top_k_accuracy = [int(k) for k in top_k_accuracy]
 
     if not os.path.exists(DATA_DIR):
         os.mkdir(DATA_DIR)
+    if profile_path is not None and jobs > 1:
+        raise click.UsageError("--profile only profiles the main process: use 1 job.")
+    if any(sd > 0 for sd in shared_dictionary_size):
+        for c, s in itertools.product(compressor, size):
+            if not COMPRESSOR_PROVIDERS[c](s).supports_shared_dictionary():
+                raise click.UsageError(f"--shared_dictionary_size requires compressors that support a shared "
+                                       f"dictionary: {c} with size {s} doesn't. Use zstd with size -1.")
+
+    configurations = []
+    for s, k, cpc, c, cp, sb, ag, sd, cb in itertools.product(size, top_k_accuracy, compressors_per_class, compressor,
+                                                              cascade_prefix, sample_budget, aggregation,
+                                                              shared_dictionary_size, compressor_budget):
+        size_message = "dataset_prefixed" if s == -1 else (
+            "size_unbounded_optimized" if s == 0 else f"size_bounded_{s}")
+        layout_message = f"CPC_{cpc}" if cb == 0 else f"compressor_budget_{cb}"
+        method_name = f"FFTC {c} {size_message} {layout_message}" + (f" top_{k} accuracy" if k > 1 else "") + (
+            f" cascade_{cp}_{cascade_keep}" if cp > 0 else "") + (f" sampled_{sb}" if sb > 0 else "") + (
+            f" aggregation_{ag}" if ag != "sum" else "") + (f" shared_{sd}" if sd > 0 else "")
+        configurations.append({"method": method_name, "size": s, "top_k": k, "cpc": cpc, "compressor": c,
+                               "cascade_prefix": cp, "cascade_keep": cascade_keep, "sample_budget": sb,
+                               "aggregation": ag, "shared_dictionary_size": sd, "compressor_budget": cb,
+                               "workers": workers, "backend": backend, "dataset_cache": dataset_cache,
+                               "instrument": instrument})
+
+    # cells are sorted by dataset, so that consecutive cells run by a process share their dataset
+    cells = [{**configuration, "dataset": d} for d in dataset for configuration in configurations]
+    cell_results = read_results(results_file)
+    todo = [cell for cell in cells if (cell["method"], cell["dataset"]) not in cell_results]
+    print(f"{len(cells) - len(todo)} cells of {len(cells)} already in {results_file}. Running {len(todo)} cells.")
+    profiler = cProfile.Profile() if profile_path is not None else None
+    if profiler is not None:
+        profiler.enable()
+    for cell_result in run_cells(todo, jobs):
+        append_result(results_file, cell_result)
+        cell_results[(cell_result["Method"], cell_result["Dataset"])] = cell_result
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_PRINTED_FUNCTIONS)
 
     results = []
     speed_results = []
     size_results = []
-    for s in size:
-        for k in top_k_accuracy:
-            for cpc in compressors_per_class:
-                for c in compressor:
-                    size_message = "dataset_prefixed" if s == -1 else (
-                        "size_unbounded_optimized" if s == 0 else f"size_bounded_{s}")
-                    method_name = f"FFTC {c} {size_message} CPC_{cpc}" + (f" top_{k} accuracy" if k > 1 else "")
-                    method_result = {"Method": method_name}
-                    speed_result = {"Method": method_name}
-                    size_result = {"Method": method_name}
-                    for d in dataset:
-                        loader = DATASET_TO_LOADER[d]
-                        print(f"Loading dataset {d}. It will be downloaded if not available in the {DATA_DIR} folder.")
-                        dataset_pair = loader()
-                        train_pair, test_pair = dataset_pair[0], dataset_pair[1]
-
-                        print(f"Training classifier {method_name} for dataset {d}.")
-                        compressor_provider = COMPRESSOR_PROVIDERS[c]
-                        classifier = CompressorClassifier(lambda: compressor_provider(s), k,
-                                                          num_compressors_per_class=cpc)
-                        start = time.monotonic()
-                        classifier.fit(train_pair)
-                        training_time = time.monotonic() - start
-
-                        # todo extract this
-                        print(f"Running evaluation for classifier {method_name} for dataset {d}.")
-                        run_times_millis = []
-                        obs_count = 0
-                        correct_obs_count = 0
-                        for (label, observation) in test_pair:
-                            start = time.monotonic()
-                            predicted = classifier.predict(observation)
-                            end = time.monotonic()
-                            run_times_millis.append((end - start) * 1000)
-                            obs_count += 1
-                            if label in predicted:
-                                # if predicted == label:
-                                correct_obs_count += 1
-
-                        accuracy = correct_obs_count / obs_count
-                        print(
-                            f"Accuracy on dataset {d}: {accuracy * 100}%. \nTraining time: {training_time}s. \nPrediction times: p50: {np.percentile(run_times_millis, 50)}ms, p90: {np.percentile(run_times_millis, 90)}ms, p99: {np.percentile(run_times_millis, 99)}ms.")
-                        method_result[d] = accuracy
-                        size_result[d] = f"{classifier.dictionaries_size() / 1e6} Mb"
-                        speed_result[d + "_train"] = f"{round(training_time, 1)}s"
-                        speed_result[d + "_predict_p90"] = f"{round(np.percentile(run_times_millis, 90), 3)}ms"
-                    results.append(method_result)
-                    speed_results.append(speed_result)
-                    size_results.append(size_result)
+    sampling_results = []
+    for configuration in configurations:
+        method_name = configuration["method"]
+        method_result = {"Method": method_name}
+        speed_result = {"Method": method_name}
+        size_result = {"Method": method_name}
+        for d in dataset:
+            cell_result = cell_results[(method_name, d)]
+            method_result[d] = cell_result["Accuracy"]
+            size_result[d] = f"{cell_result['Dictionaries size'] / 1e6} Mb"
+            speed_result[d + "_train"] = f"{round(cell_result['Training time'], 1)}s"
+            speed_result[d + "_predict_p90"] = f"{round(cell_result['Prediction p90'], 3)}ms"
+            sampling_results.append({"Method": method_name, "Dataset": d,
+                                     "Sample budget": configuration["sample_budget"],
+                                     "Training time": f"{round(cell_result['Training time'], 1)}s",
+                                     "Accuracy": cell_result["Accuracy"]})
+        results.append(method_result)
+        speed_results.append(speed_result)
+        size_results.append(size_result)
 
     write_csv('accuracy_results.csv', results)
     write_csv('speed_results.csv', speed_results)
@@ -147,7 +221,136 @@ def run_experiment(dataset, compressor, top_k_accuracy, compressors_per_class, s
     print(speed_table)
     size_table = markdown_table(size_results).set_params(float_rounding=0).get_markdown()
     print(size_table)
+    if len(sample_budget) > 1:
+        # training time against accuracy for each sample budget
+        sampling_results.sort(key=lambda r: (r["Dataset"], r["Method"].replace(f" sampled_{r['Sample budget']}", ""),
+                                             r["Sample budget"]))
+        sampling_table = markdown_table(sampling_results).set_params(float_rounding=3).get_markdown()
+        print(sampling_table)
+
+
+# results of the cells already run, by method and dataset
+def read_results(results_file: str) -> dict:
+    cell_results = {}
+    if os.path.exists(results_file):
+        with open(results_file, encoding="utf-8") as f:
+            for line in f:
+                # the last line is incomplete if a run was killed while writing it
+                try:
+                    cell_result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cell_results[(cell_result["Method"], cell_result["Dataset"])] = cell_result
+    return cell_results
+
+
+def append_result(results_file: str, cell_result: dict):
+    with open(results_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(cell_result) + "\n")
+
+
+# results are returned in the order the cells finish
+def run_cells(cells: List[dict], jobs: int) -> Iterator[dict]:
+    if jobs <= 1:
+        for cell in cells:
+            yield run_cell(cell)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for future in as_completed([executor.submit(run_cell, cell) for cell in cells]):
+            yield future.result()
+
+
+# last dataset loaded by the process: consecutive cells on the same dataset don't load it again
+_loaded_dataset = (None, None)
+
+
+def get_dataset(d: str, dataset_cache: bool):
+    global _loaded_dataset
+    if _loaded_dataset[0] != (d, dataset_cache):
+        # the previous dataset is released before the next one is loaded
+        _loaded_dataset = (None, None)
+        loader = DATASET_TO_LOADER[d]
+        print(f"Loading dataset {d}. It will be downloaded if not available in the {DATA_DIR} folder.")
+        if dataset_cache:
+            dataset_pair = load_cached(d, loader, DATASET_CACHE_DIR, version=DATASET_VERSIONS.get(d, 1))
+        else:
+            # torchtext datasets can only be iterated once
+            dataset_pair = tuple(list(pairs) for pairs in loader())
+        _loaded_dataset = ((d, dataset_cache), dataset_pair)
+    return _loaded_dataset[1]
+
+
+def run_cell(cell: dict) -> dict:
+    method_name, d, s, cb = cell["method"], cell["dataset"], cell["size"], cell["compressor_budget"]
+    workers, backend = cell["workers"], cell["backend"]
+    train_pair, test_pair = get_dataset(d, cell["dataset_cache"])
+
+    if cell["instrument"]:
+        # counters are per process: they are reset so that they only count this cell
+        instrumentation.enable().reset()
+    print(f"Training classifier {method_name} for dataset {d}.")
+    compressor_provider = COMPRESSOR_PROVIDERS[cell["compressor"]]
+    classifier = CompressorClassifier(lambda: compressor_provider(s), cell["top_k"],
+                                      num_compressors_per_class=cell["cpc"], cascade_prefix=cell["cascade_prefix"],
+                                      cascade_keep=cell["cascade_keep"], sample_budget=cell["sample_budget"],
+                                      aggregation=cell["aggregation"],
+                                      shared_dictionary_size=cell["shared_dictionary_size"], compressor_budget=cb)
+    start = time.monotonic()
+    classifier.fit(train_pair, workers=workers, backend=backend)
+    training_time = time.monotonic() - start
+    if cb > 0:
+        layout = {label: len(compressors) for label, compressors in classifier.label_to_compressors.items()}
+        print(f"Compressors per class: {layout}")
+
+    # todo extract this
+    print(f"Running evaluation for classifier {method_name} for dataset {d}.")
+    run_times_millis = []
+    obs_count = 0
+    correct_obs_count = 0
+    if workers > 1:
+        start = time.monotonic()
+        predictions = classifier.predict_batch([observation for _, observation in test_pair],
+                                               workers=workers, backend=backend)
+        end = time.monotonic()
+        # per observation latencies are not available in batch mode - use the average
+        run_times_millis = [(end - start) * 1000 / max(len(test_pair), 1)] * len(test_pair)
+        for (label, _), predicted in zip(test_pair, predictions):
+            obs_count += 1
+            if label in predicted:
+                correct_obs_count += 1
+    else:
+        for (label, observation) in test_pair:
+            start = time.monotonic()
+            predicted = classifier.predict(observation)
+            end = time.monotonic()
+            run_times_millis.append((end - start) * 1000)
+            obs_count += 1
+            if label in predicted:
+                # if predicted == label:
+                correct_obs_count += 1
+
+    accuracy = correct_obs_count / obs_count
+    if cell["instrument"]:
+        print_counters(instrumentation.active().snapshot())
+    print(
+        f"Accuracy on dataset {d}: {accuracy * 100}%. \nTraining time: {training_time}s. \nPrediction times: p50: {np.percentile(run_times_millis, 50)}ms, p90: {np.percentile(run_times_millis, 90)}ms, p99: {np.percentile(run_times_millis, 99)}ms.")
+    return {"Method": method_name, "Dataset": d, "Accuracy": accuracy, "Training time": training_time,
+            "Prediction p50": np.percentile(run_times_millis, 50), "Prediction p90": np.percentile(run_times_millis, 90),
+            "Prediction p99": np.percentile(run_times_millis, 99), "Dictionaries size": classifier.dictionaries_size()}
+
 
+# counters without labels - the phases -, then the slowest counters of each name with labels, eg the compressors
+def print_counters(snapshot: List[dict]):
+    entries = [entry for entry in snapshot if not entry["labels"]]
+    for name in dict.fromkeys(entry["name"] for entry in snapshot if entry["labels"]):
+        labeled = sorted((entry for entry in snapshot if entry["name"] == name and entry["labels"]),
+                         key=lambda entry: -entry["ns"])
+        entries.extend(labeled[:INSTRUMENTATION_PRINTED_COUNTERS])
+    rows = [{"Counter": entry["name"], "Labels": " ".join(f"{k}={v}" for k, v in entry["labels"].items()),
+             "Calls": entry["calls"], "Total": f"{round(entry['ns'] / 1e6, 1)}ms",
+             "Per call": f"{round(entry['ns'] / max(entry['calls'], 1) / 1e3, 2)}us",
+             "Bytes in": entry["bytes_in"], "Bytes out": entry["bytes_out"]} for entry in entries]
+    print(markdown_table(rows).get_markdown())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+import heapq
+import random
+from typing import List
+
+
+# Reservoir sampling with a budget in bytes.
+# Each item gets a random priority, the sample is the items with the smallest priorities whose total size fits in the
+# budget. Deterministic: the same items added in the same order with the same seed give the same sample.
+# The memory used is bounded by the budget, so it can sample a stream of items.
+# At least one item is kept, even if it is bigger than the budget.
+class ByteReservoir:
+
+    def __init__(self, budget: int, seed=0):
+        if budget <= 0:
+            raise ValueError("budget must be a positive number of bytes.")
+        self.budget = budget
+        self._random = random.Random(seed)
+        # max heap of (-priority, arrival index, item)
+        self._heap = []
+        self._count = 0
+        self.size = 0
+
+    def add(self, item: bytes):
+        heapq.heappush(self._heap, (-self._random.random(), self._count, item))
+        self._count += 1
+        self.size += len(item)
+        while self.size > self.budget and len(self._heap) > 1:
+            _, _, evicted = heapq.heappop(self._heap)
+            self.size -= len(evicted)
+
+    # sampled items, in the order they were added
+    def items(self) -> List[bytes]:
+        return [item for _, _, item in sorted(self._heap, key=lambda e: e[1])]
+
+
+def sample(items: List[bytes], budget: int, seed=0) -> List[bytes]:
+    reservoir = ByteReservoir(budget, seed)
+    for item in items:
+        reservoir.add(item)
+    return reservoir.items()
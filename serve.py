@@ -0,0 +1,205 @@
+# Online inference server for a saved classifier.
+# Requests received within a small time window are scored together in one batch, on a thread pool.
+# python serve.py -m model.ftcc -p 8888
+# POST /predict {"text": "..."} -> {"labels": [...]}
+# POST /predict_batch {"texts": ["...", ...]} -> {"labels": [[...], ...]}
+# GET /metrics -> queue depth, batch sizes, request latencies, cache hits and misses
+# GET /metrics/prometheus -> with --instrument, the counters of the classifier in the Prometheus text format
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+import tornado.web
+
+import instrumentation
+from cache import PredictionCache
+from compressorclassifier import CompressorClassifier
+
+# number of recent batches and requests used for the metrics
+METRICS_WINDOW = 10000
+
+
+class MicroBatcher:
+
+    def __init__(self, classifier: CompressorClassifier, batch_window_ms: float, max_batch_size: int, workers: int):
+        self.classifier = classifier
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self.latencies_millis = deque(maxlen=METRICS_WINDOW)
+        self.num_requests = 0
+        self.num_batches = 0
+
+    # must be called in the event loop
+    def start(self):
+        self.queue = asyncio.Queue()
+        # at most one batch per worker thread is scored at a time, other texts wait in the queue
+        self.semaphore = asyncio.Semaphore(self.workers)
+        # the event loop only keeps weak references to the tasks: they are referenced here until they are done
+        self.scoring_tasks = set()
+        self.run_task = asyncio.ensure_future(self._run())
+
+    async def predict(self, text: str):
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # let concurrent requests arrive, then take all the waiting texts
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.max_batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self.semaphore.acquire()
+            task = asyncio.ensure_future(self._score(batch))
+            self.scoring_tasks.add(task)
+            task.add_done_callback(self.scoring_tasks.discard)
+
+    async def _score(self, batch):
+        try:
+            texts = [text for text, _ in batch]
+            try:
+                predictions = await asyncio.get_event_loop().run_in_executor(self.executor,
+                                                                             self.classifier.predict_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), predicted in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(predicted)
+            self.batch_sizes.append(len(batch))
+            self.num_batches += 1
+        finally:
+            self.semaphore.release()
+
+    def record(self, latency_millis: float):
+        self.num_requests += 1
+        self.latencies_millis.append(latency_millis)
+
+    def metrics(self) -> dict:
+        metrics = {
+            "queue_depth": self.queue.qsize(),
+            "requests": self.num_requests,
+            "batches": self.num_batches,
+            "batch_size": _summary(self.batch_sizes),
+            "latency_millis": _summary(self.latencies_millis),
+        }
+        if self.classifier.cache is not None:
+            metrics["cache"] = self.classifier.cache.stats()
+        return metrics
+
+
+def _summary(values) -> dict:
+    if not values:
+        return {"mean": None, "p50": None, "p99": None, "max": None}
+    return {"mean": float(np.mean(values)), "p50": float(np.percentile(values, 50)),
+            "p99": float(np.percentile(values, 99)), "max": float(np.max(values))}
+
+
+class BaseHandler(tornado.web.RequestHandler):
+
+    def initialize(self, batcher: MicroBatcher):
+        self.batcher = batcher
+
+    def json_body(self) -> dict:
+        try:
+            body = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Invalid JSON body")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="JSON body must be an object")
+        return body
+
+
+class PredictHandler(BaseHandler):
+
+    async def post(self):
+        start = time.monotonic()
+        text = self.json_body().get("text")
+        if not isinstance(text, str):
+            raise tornado.web.HTTPError(400, reason="text must be a string")
+        labels = await self.batcher.predict(text)
+        self.write({"labels": labels})
+        self.batcher.record((time.monotonic() - start) * 1000)
+
+
+class PredictBatchHandler(BaseHandler):
+
+    async def post(self):
+        start = time.monotonic()
+        texts = self.json_body().get("texts")
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise tornado.web.HTTPError(400, reason="texts must be a list of strings")
+        # texts are batched with the texts of the other requests
+        labels = await asyncio.gather(*[self.batcher.predict(text) for text in texts])
+        self.write({"labels": list(labels)})
+        self.batcher.record((time.monotonic() - start) * 1000)
+
+
+class MetricsHandler(BaseHandler):
+
+    def get(self):
+        self.write(self.batcher.metrics())
+
+
+class PrometheusHandler(BaseHandler):
+
+    def get(self):
+        counters = instrumentation.active()
+        if counters is None:
+            raise tornado.web.HTTPError(404, reason="Instrumentation is disabled. Start the server with --instrument.")
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(counters.prometheus())
+
+
+def make_app(batcher: MicroBatcher) -> tornado.web.Application:
+    return tornado.web.Application([
+        (r"/predict", PredictHandler, {"batcher": batcher}),
+        (r"/predict_batch", PredictBatchHandler, {"batcher": batcher}),
+        (r"/metrics", MetricsHandler, {"batcher": batcher}),
+        (r"/metrics/prometheus", PrometheusHandler, {"batcher": batcher}),
+    ])
+
+
+@click.command()
+@click.option("-m", "--model", "model_path", required=True, help="Path of a model saved with CompressorClassifier.save.")
+@click.option("-p", "--port", type=int, default=8888)
+@click.option("--batch_window_ms", help="Time window in which concurrent requests are scored together.", type=float,
+              default=2)
+@click.option("--max_batch_size", type=int, default=64)
+@click.option("-w", "--workers", help="Number of threads scoring batches.", type=int, default=4)
+@click.option("--cache_entries", help="Maximum number of cached predictions. 0 disables the cache.", type=int,
+              default=0)
+@click.option("--cache_ttl_s", help="Time after which a cached prediction expires. By default predictions don't expire.",
+              type=float, default=None)
+@click.option("--instrument", help="Count the calls, time and bytes of the prediction phases and of each compressor.",
+              is_flag=True)
+def serve(model_path, port, batch_window_ms, max_batch_size, workers, cache_entries, cache_ttl_s, instrument):
+    if instrument:
+        instrumentation.enable()
+    cache = PredictionCache(max_entries=cache_entries, ttl_seconds=cache_ttl_s) if cache_entries > 0 else None
+    classifier = CompressorClassifier.load(model_path, cache=cache)
+    print(f"Loaded model {model_path}: {len(classifier.label_to_compressors)} classes.")
+    batcher = MicroBatcher(classifier, batch_window_ms, max_batch_size, workers)
+
+    async def main():
+        batcher.start()
+        make_app(batcher).listen(port)
+        print(f"Listening on port {port}.")
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+if __name__ == '__main__':
+    serve()
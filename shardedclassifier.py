@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import heapq
+from concurrent.futures import ProcessPoolExecutor, Future
+from math import ceil
+from typing import List, Tuple, Callable, Union
+
+import numpy as np
+
+from aggregation import MISSING_SCORE, Aggregation, top_k_indices
+from compressorclassifier import CompressorClassifier, load_header
+from compressors.compressor import ENCODING
+
+# aggregations where the cost of a class depends on the scores of the other classes can't be computed by shards
+CROSS_CLASS_AGGREGATIONS = ["vote"]
+
+
+# The classes of a classifier are split between num_shards worker processes. Each process only keeps the compressors
+# of its classes. Texts are sent to all the shards, each shard returns the costs of its best classes, then the results
+# are merged. Only texts, costs and label indices are sent between processes.
+# Predictions are the same as the predictions of the classifier.
+# Classes are assigned to shards by dictionary size, so that shards have about the same amount of work.
+# Use from_classifier or load to create a sharded classifier, and close it to stop the processes.
+class ShardedCompressorClassifier:
+
+    def __init__(self, labels: List, shard_initializers: List[Tuple[Callable, tuple]], top_k=1, cascade_prefix=0,
+                 cascade_keep=0.2, aggregation: Union[str, Aggregation] = "sum", batch_size=256):
+        if isinstance(aggregation, str) and aggregation in CROSS_CLASS_AGGREGATIONS:
+            raise ValueError(f"Aggregation {aggregation} can't be sharded. Use a per-class aggregation.")
+        self._labels = labels
+        self.top_k = top_k
+        self.cascade_prefix = cascade_prefix
+        self.cascade_keep = cascade_keep
+        self.batch_size = batch_size
+        self._executors = [ProcessPoolExecutor(max_workers=1, initializer=initializer, initargs=initargs) for
+                           initializer, initargs in shard_initializers]
+
+    # the compressors of each shard are sent once, when its process starts
+    @classmethod
+    def from_classifier(cls, classifier: CompressorClassifier, num_shards: int, batch_size=256) \
+            -> ShardedCompressorClassifier:
+        labels = classifier.labels()
+        sizes = [sum(c.dictionary_size() for c in compressors) for compressors in
+                 classifier.label_to_compressors.values()]
+        shard_initializers = []
+        for label_indices in _partition(sizes, num_shards):
+            shard = classifier._without_provider()
+            shard.label_to_compressors = {labels[i]: classifier.label_to_compressors[labels[i]] for i in label_indices}
+            shard_initializers.append((_init_shard, (shard, label_indices)))
+        return cls(labels, shard_initializers, top_k=classifier.top_k, cascade_prefix=classifier.cascade_prefix,
+                   cascade_keep=classifier.cascade_keep, aggregation=classifier.aggregation, batch_size=batch_size)
+
+    # each shard process loads its classes from the memory-mapped model file: dictionaries are not sent to processes
+    @classmethod
+    def load(cls, path: str, num_shards: int, batch_size=256) -> ShardedCompressorClassifier:
+        header = load_header(path)
+        labels = [entry["label"] for entry in header["classes"]]
+        sizes = [sum(c["length"] for c in entry["compressors"]) for entry in header["classes"]]
+        shard_initializers = [(_load_shard, (path, [labels[i] for i in label_indices], label_indices)) for
+                              label_indices in _partition(sizes, num_shards)]
+        return cls(labels, shard_initializers, top_k=header["top_k"], cascade_prefix=header["cascade_prefix"],
+                   cascade_keep=header["cascade_keep"], aggregation=header.get("aggregation", "sum"),
+                   batch_size=batch_size)
+
+    def labels(self) -> List:
+        return list(self._labels)
+
+    def predict(self, text):
+        return self.predict_batch([text])[0]
+
+    # texts are sent to the shards by batches of batch_size texts. All the batches are queued at once, so that the
+    # shards don't wait for each other between batches.
+    def predict_batch(self, texts: List[str]) -> List[List[str]]:
+        cascades = self.cascade_prefix > 0 and self._num_candidates() < len(self._labels)
+        k = self._num_candidates() if cascades else self.top_k
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        chunk_futures = [self._broadcast("best", chunk, k, self.cascade_prefix if cascades else 0) for chunk in
+                         chunks]
+        res = []
+        for chunk, futures in zip(chunks, chunk_futures):
+            best = _merge([future.result() for future in futures], k)
+            if cascades:
+                # the second stage only scores the best classes of the prefix, on the shards that have them.
+                # If the input is not longer than the prefix, the prefix scores are already the final scores.
+                long = [i for i, text in enumerate(chunk) if len(text.encode(ENCODING)) > self.cascade_prefix]
+                if long:
+                    futures = self._broadcast("best_of", [chunk[i] for i in long], best[long], self.top_k)
+                    best[long, :self.top_k] = _merge([future.result() for future in futures], self.top_k)
+            res.extend([self._labels[j] for j in row[:self.top_k]] for row in best)
+        return res
+
+    def _broadcast(self, method: str, *args) -> List[Future]:
+        return [executor.submit(_call_shard, method, *args) for executor in self._executors]
+
+    def _num_candidates(self) -> int:
+        return max(self.top_k, ceil(self.cascade_keep * len(self._labels)))
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown()
+
+    def __enter__(self) -> ShardedCompressorClassifier:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# the classes of a shard process. label_indices are the indices of its classes in the labels of the classifier.
+class _Shard:
+
+    def __init__(self, classifier: CompressorClassifier, label_indices: np.ndarray):
+        self.classifier = classifier
+        self.label_indices = label_indices
+
+    # costs and label indices of the k best classes of the shard for each text, best first, of shape (n_texts, k)
+    def best(self, texts: List[str], k: int, prefix: int) -> Tuple[np.ndarray, np.ndarray]:
+        data = [text.encode(ENCODING) for text in texts]
+        lengths = np.array([len(d) for d in data], dtype=np.int64)
+        if prefix > 0:
+            data = [memoryview(d)[:prefix] for d in data]
+            lengths = np.minimum(lengths, prefix)
+        return self._best(self.classifier._score_matrix(data), lengths, k)
+
+    # same as best, but only the classes in candidates - label indices for each text - are scored
+    def best_of(self, texts: List[str], candidates: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        compressors = list(self.classifier.label_to_compressors.values())
+        num_compressors = max((len(c) for c in compressors), default=0)
+        scores = np.full((len(texts), len(compressors), num_compressors), MISSING_SCORE, dtype=np.int32)
+        lengths = np.empty(len(texts), dtype=np.int64)
+        for i, (text, text_candidates) in enumerate(zip(texts, candidates)):
+            d = text.encode(ENCODING)
+            lengths[i] = len(d)
+            for j in np.flatnonzero(np.isin(self.label_indices, text_candidates)):
+                for c_index, c in enumerate(compressors[j]):
+                    scores[i, j, c_index] = c.get_compressed_len_bytes(d)
+        return self._best(scores, lengths, k)
+
+    def _best(self, scores: np.ndarray, lengths: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        costs = self.classifier._aggregate(scores, lengths)
+        best = top_k_indices(costs, min(k, costs.shape[1]))
+        return np.take_along_axis(costs, best, axis=1), self.label_indices[best]
+
+
+# label indices of the k best classes of each text, best first. Ties are broken by the lowest label index.
+def _merge(results: List[Tuple[np.ndarray, np.ndarray]], k: int) -> np.ndarray:
+    costs = np.concatenate([costs for costs, _ in results], axis=1)
+    label_indices = np.concatenate([label_indices for _, label_indices in results], axis=1)
+    order = np.lexsort((label_indices, costs), axis=-1)[:, :k]
+    return np.take_along_axis(label_indices, order, axis=1)
+
+
+# greedy assignment of the biggest classes to the least loaded shard. The label indices of a shard are sorted, so that
+# ties between the classes of a shard are broken like in the classifier.
+def _partition(sizes: List[int], num_shards: int) -> List[np.ndarray]:
+    if num_shards < 1:
+        raise ValueError("Invalid num_shards value. Must be at least 1.")
+    shards = [(0, s, []) for s in range(min(num_shards, len(sizes)))]
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+        load, s, label_indices = heapq.heappop(shards)
+        label_indices.append(i)
+        heapq.heappush(shards, (load + sizes[i], s, label_indices))
+    return [np.array(sorted(label_indices), dtype=np.int64) for _, _, label_indices in
+            sorted(shards, key=lambda shard: shard[1])]
+
+
+# set in each shard process by the pool initializer
+_worker_shard = None
+
+
+def _init_shard(classifier: CompressorClassifier, label_indices: np.ndarray):
+    global _worker_shard
+    _worker_shard = _Shard(classifier, label_indices)
+
+
+def _load_shard(path: str, labels: List, label_indices: np.ndarray):
+    _init_shard(CompressorClassifier.load(path, labels=labels), label_indices)
+
+
+def _call_shard(method: str, *args):
+    return getattr(_worker_shard, method)(*args)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from aggregation import AGGREGATIONS, MISSING_SCORE, PARTITION_MIN_CLASSES, top_k_indices
+
+M = MISSING_SCORE
+# 2 texts, 3 classes, 2 compressors. Class 1 has one compressor, class 2 was not scored for the second text
+SCORES = np.array([
+    [[10, 20], [12, M], [9, 30]],
+    [[7, 5], [6, M], [M, M]],
+], dtype=np.int32)
+LENGTHS = np.array([40, 0], dtype=np.int64)
+
+
+def test_sum():
+    assert AGGREGATIONS["sum"](SCORES, LENGTHS).tolist() == [[30, 12, 39], [12, 6, np.inf]]
+
+
+def test_mean():
+    assert AGGREGATIONS["mean"](SCORES, LENGTHS).tolist() == [[15, 12, 19.5], [6, 6, np.inf]]
+
+
+def test_min():
+    assert AGGREGATIONS["min"](SCORES, LENGTHS).tolist() == [[10, 12, 9], [5, 6, np.inf]]
+
+
+def test_vote():
+    costs = AGGREGATIONS["vote"](SCORES, LENGTHS)
+    # text 0: the first compressors vote for class 2, the second ones for class 0
+    # text 1: the first compressors vote for class 1, the second ones for class 0, the lower sum breaks the tie
+    assert costs[0].argsort(kind="stable").tolist() == [0, 2, 1]
+    assert costs[1].argsort(kind="stable").tolist() == [1, 0, 2]
+    assert costs[1, 2] == np.inf
+    # the sum tie-breaker never changes the number of votes
+    assert np.ceil(-costs[:, :2]).tolist() == [[1, 0], [1, 1]]
+
+
+def test_normalized():
+    costs = AGGREGATIONS["normalized"](SCORES, LENGTHS)
+    # texts of 0 bytes are divided by 1
+    assert costs.tolist() == [[15 / 40, 12 / 40, 19.5 / 40], [6, 6, np.inf]]
+
+
+@pytest.mark.parametrize("name", list(AGGREGATIONS))
+def test_class_without_scores_is_never_predicted(name):
+    costs = AGGREGATIONS[name](SCORES, LENGTHS)
+    assert top_k_indices(costs, 1)[1, 0] != 2
+    assert top_k_indices(costs, 3)[1, -1] == 2
+
+
+@pytest.mark.parametrize("num_classes", [5, PARTITION_MIN_CLASSES + 5])
+@pytest.mark.parametrize("k", [1, 2, 3, 5])
+def test_top_k_ties_keep_the_lowest_indices(num_classes, k):
+    rng = np.random.default_rng(0)
+    # few distinct costs: many ties, including at the k-th cost
+    costs = rng.integers(0, 3, size=(50, num_classes)).astype(np.float64)
+    expected = np.argsort(costs, axis=1, kind="stable")[:, :k]
+    assert top_k_indices(costs, k).tolist() == expected.tolist()
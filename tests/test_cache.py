@@ -0,0 +1,17 @@
+from cache import PredictionCache
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+
+TRAIN = [("a", "the cat sat on the mat"), ("a", "a cat and a mat"), ("b", "stocks fell on monday"),
+         ("b", "the market rallied")]
+
+
+# a batch whose texts are all cached is not scored
+def test_predict_batch_all_cached():
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=-1), cache=PredictionCache())
+    classifier.fit(TRAIN)
+    text = "the cat on the mat"
+    predicted = classifier.predict(text)
+    assert classifier.predict(text) == predicted
+    assert classifier.predict_batch([text, text]) == [predicted, predicted]
+    assert classifier.predict_batch([]) == []
@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pytest
+
+from bench.synthetic import generate
+from compressorclassifier import BACKENDS, CompressorClassifier, _map_bounded
+from compressors.ngram_compressor import NgramCompressor
+from compressors.zlib_compressor import ZlibCompressor
+from compressors.zstd_compressor import ZstdCompressor
+
+TRAIN = [("a", "the cat sat on the mat"), ("b", "stocks fell on monday")]
+
+
+def test_empty_batch():
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=-1))
+    classifier.fit(TRAIN)
+    assert classifier.predict_batch([]) == []
+    assert classifier.score_batch([]).shape == (0, 2, 1)
+
+
+def test_shared_dictionary_rejected_before_training():
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=0), shared_dictionary_size=100)
+    with pytest.raises(ValueError):
+        classifier.fit(TRAIN)
+
+
+def test_compressor_budget_builds_the_allocation():
+    train = [(label, f"text {i} of {label}") for label in "abc" for i in range(7)]
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=-1), compressor_budget=8, aggregation="mean")
+    classifier.fit(train)
+    assert sum(len(compressors) for compressors in classifier.label_to_compressors.values()) == 8
+    with pytest.raises(ValueError):
+        CompressorClassifier(lambda: ZstdCompressor(size=-1), compressor_budget=2, aggregation="mean").fit(train)
+
+
+def test_add_class_without_texts():
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=-1))
+    classifier.fit(TRAIN)
+    with pytest.raises(ValueError):
+        classifier.add_class("c", [])
+
+
+# a model can be built class by class, without fit
+def test_add_class_without_fit():
+    classifier = CompressorClassifier(lambda: ZstdCompressor(size=-1))
+    for label, text in TRAIN:
+        classifier.add_class(label, [text])
+    fitted = CompressorClassifier(lambda: ZstdCompressor(size=-1))
+    fitted.fit(TRAIN)
+    texts = ["the cat", "stocks on monday"]
+    assert classifier.predict_batch(texts) == fitted.predict_batch(texts)
+
+
+# deterministic synthetic dataset with a few classes, scored by the parallel tests
+def synthetic_dataset():
+    return generate(num_classes=4, docs_per_class=20, words_per_doc=20, shared_vocabulary_size=200,
+                    class_vocabulary_size=50)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_predict_batch_matches_predict(backend):
+    train_pair, test_pair = synthetic_dataset()
+    # the provider can be sent to worker processes
+    classifier = CompressorClassifier(partial(ZstdCompressor, size=-1), num_compressors_per_class=3)
+    classifier.fit(train_pair)
+    texts = [text for _, text in test_pair]
+    serial = [classifier.predict(text) for text in texts]
+    assert classifier.predict_batch(texts) == serial
+    assert classifier.predict_batch(texts, workers=2, backend=backend) == serial
+
+
+@pytest.mark.parametrize("provider", [partial(ZstdCompressor, size=-1), partial(ZstdCompressor, size=2000),
+                                      partial(ZlibCompressor, size=-1), partial(NgramCompressor, size=-1)])
+def test_save_load_round_trip(tmp_path, provider):
+    train_pair, test_pair = synthetic_dataset()
+    classifier = CompressorClassifier(provider, num_compressors_per_class=2)
+    classifier.fit(train_pair)
+    path = str(tmp_path / "model.bin")
+    classifier.save(path)
+    loaded = CompressorClassifier.load(path)
+    texts = [text for _, text in test_pair]
+    assert loaded.predict_batch(texts) == classifier.predict_batch(texts)
+    assert list(loaded.label_to_compressors) == list(classifier.label_to_compressors)
+    for label, compressors in classifier.label_to_compressors.items():
+        assert [c.get_params() for c in loaded.label_to_compressors[label]] == [c.get_params() for c in compressors]
+
+
+# 4 classes of 3 compressors: 12 chunks, more than the window of 2 workers
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("size", [-1, 2000])
+def test_parallel_fit_matches_serial_fit(backend, size):
+    train_pair, _ = synthetic_dataset()
+    serial = CompressorClassifier(partial(ZstdCompressor, size=size), num_compressors_per_class=3)
+    serial.fit(train_pair)
+    parallel = CompressorClassifier(partial(ZstdCompressor, size=size), num_compressors_per_class=3)
+    parallel.fit(train_pair, workers=2, backend=backend)
+    assert list(parallel.label_to_compressors) == list(serial.label_to_compressors)
+    for label, compressors in serial.label_to_compressors.items():
+        assert [bytes(c.get_dictionary()) for c in parallel.label_to_compressors[label]] == \
+               [bytes(c.get_dictionary()) for c in compressors]
+
+
+@pytest.mark.parametrize("window", [1, 2, 5])
+def test_map_bounded_keeps_order_and_window(window):
+    submitted = []
+
+    def items():
+        for i in range(10):
+            submitted.append(i)
+            yield i
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = _map_bounded(executor, lambda i: i * i, items(), window)
+        for i, result in enumerate(results):
+            assert result == i * i
+            # items are taken from the iterator when there is room in the window
+            assert len(submitted) <= i + window + 1
+    assert submitted == list(range(10))
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from compressorclassifier import _join
+from compressors.compressor import ENCODING
+from compressors.lz77_compressor import Lz77Compressor
+from compressors.zlib_compressor import ZlibCompressor
+
+WORDS = ["market", "shares", "oil", "price", "rose", "fell", "bank", "rate", "trade", "grain", "profit", "net"]
+TEXTS = [" ".join(random.Random(i).choices(WORDS, k=random.Random(-i).randint(1, 30))) for i in range(40)]
+INPUTS = [text.encode(ENCODING) for text in ["oil price rose", "net profit fell", "", "é" * 10, TEXTS[0] * 3]]
+
+
+# lz4 and brotli are optional dependencies
+def lz4_compressor(**params):
+    pytest.importorskip("lz4")
+    from compressors.lz4_compressor import Lz4Compressor
+    return Lz4Compressor(**params)
+
+
+def brotli_compressor(**params):
+    pytest.importorskip("brotli")
+    from compressors.brotli_compressor import BrotliCompressor
+    return BrotliCompressor(**params)
+
+
+CODECS = [Lz77Compressor, ZlibCompressor, lz4_compressor, brotli_compressor,
+          lambda **params: ZlibCompressor(compression_level=1, **params),
+          lambda **params: lz4_compressor(compression_level=9, **params)]
+
+
+# size -1 keeps all the texts, a size smaller than the texts samples them
+@pytest.mark.parametrize("size", [-1, 300])
+@pytest.mark.parametrize("codec", CODECS)
+def test_fit_buffer_is_fit(codec, size):
+    buffer, starts = _join([text.encode(ENCODING) for text in TEXTS])
+    fitted = codec(size=size).fit(TEXTS)
+    fitted_buffer = codec(size=size).fit_buffer(memoryview(buffer), starts)
+    assert fitted_buffer.get_dictionary() == fitted.get_dictionary()
+    assert fitted_buffer.get_compressed_lens_bytes(INPUTS) == fitted.get_compressed_lens_bytes(INPUTS)
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_batch_lengths_are_item_lengths(codec):
+    compressor = codec(size=300).fit(TEXTS)
+    assert compressor.get_compressed_lens_bytes(INPUTS) == \
+           [compressor.get_compressed_len_bytes(data) for data in INPUTS]
+    assert compressor.get_compressed_lens_bytes([memoryview(data) for data in INPUTS]) == \
+           [compressor.get_compressed_len_bytes(data) for data in INPUTS]
+    assert compressor.get_compressed_lens_bytes([]) == []
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import corpus
+from corpus import Corpus, as_corpus
+from datastore import read_dataset, write_dataset
+
+# labels interleaved, empty texts, non ascii texts, a label only in the test split
+TRAIN = [("b", "stocks fell"), ("a", "the cat"), ("b", ""), ("c", "é ü"), ("a", ""), ("b", "rallied"), ("a", "mat")]
+TEST = [("d", "unseen")]
+
+
+def classes(c: Corpus):
+    return [(label, bytes(view), starts.tolist()) for label, view, starts in c.classes()]
+
+
+@pytest.fixture(params=[1 << 18, 4], ids=["one_block", "small_blocks"])
+def block_size(request, monkeypatch):
+    monkeypatch.setattr(corpus, "GROUP_BLOCK_SIZE", request.param)
+
+
+def test_grouped_split_and_pairs_have_the_same_classes(tmp_path, block_size):
+    path = str(tmp_path / "dataset.ftds")
+    write_dataset(path, TRAIN, TEST)
+    train, _ = read_dataset(path)
+    from_split = Corpus.from_split(train, grouped=True)
+    from_pairs = as_corpus(TRAIN, grouped=True)
+    assert classes(from_split) == classes(from_pairs)
+    assert classes(from_pairs) == [
+        ("b", b"stocks fell\n\nrallied", [0, 12, 13]),
+        ("a", b"the cat\n\nmat", [0, 8, 9]),
+        ("c", "é ü".encode("UTF-8"), [0]),
+    ]
+
+
+def test_ungrouped_split_and_pairs_have_the_same_texts(tmp_path, block_size):
+    path = str(tmp_path / "dataset.ftds")
+    write_dataset(path, TRAIN, TEST)
+    train, _ = read_dataset(path)
+    from_split = as_corpus(train)
+    from_pairs = as_corpus(TRAIN)
+    assert [bytes(d) for d in from_split.data()] == [bytes(d) for d in from_pairs.data()] == \
+           [text.encode("UTF-8") for _, text in TRAIN]
+    assert np.array_equal(from_split.codes, from_pairs.codes)
+    assert bytes(from_split.buffer) == bytes(from_pairs.buffer)
+
+
+def test_grouped_corpus_is_not_copied():
+    grouped = as_corpus(TRAIN, grouped=True)
+    assert grouped.grouped() is grouped
+    assert as_corpus(grouped) is grouped
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from data import chunked, iter_label_directories, iter_reuters
+
+R8_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "R8")
+
+
+# the loaders before they were streamed
+def read_reuters(filename, delimiter="\t"):
+    processed_data = []
+    for row in open(filename, "r").read().strip().split("\n"):
+        label, text = row.split(delimiter)
+        processed_data.append((label, text))
+    return processed_data
+
+
+def read_label_directories(data_directory):
+    dataset = []
+    for directory_name in os.listdir(data_directory):
+        subdirectory_path = os.path.join(data_directory, directory_name)
+        if os.path.isdir(subdirectory_path):
+            for filename in os.listdir(subdirectory_path):
+                filepath = os.path.join(subdirectory_path, filename)
+                if os.path.isfile(filepath):
+                    dataset.append((directory_name, open(filepath).read().strip()))
+    return dataset
+
+
+@pytest.mark.parametrize("content", [
+    "a\tone\nb\ttwo\n",
+    "a\tone\nb\ttwo",
+    "\n \n  a\tone \nb\t two\t\n\n  \n",
+    "a\tone\r\nb\ttwo\r\n",
+    "a\t\nb\ttwo\n",
+])
+def test_iter_reuters_rows(tmp_path, content):
+    path = tmp_path / "train.txt"
+    path.write_bytes(content.encode("UTF-8"))
+    assert list(iter_reuters(str(path))) == read_reuters(str(path))
+
+
+# like the rows of the previous loader, blank lines between rows have no delimiter
+def test_iter_reuters_blank_line(tmp_path):
+    path = tmp_path / "train.txt"
+    path.write_text("a\tone\n\nb\ttwo\n")
+    with pytest.raises(ValueError):
+        read_reuters(str(path))
+    with pytest.raises(ValueError):
+        list(iter_reuters(str(path)))
+
+
+@pytest.mark.skipif(not os.path.isdir(R8_DIR), reason="R8 is not bundled")
+@pytest.mark.parametrize("filename", ["train.txt", "test.txt"])
+def test_iter_reuters_r8(filename):
+    path = os.path.join(R8_DIR, filename)
+    assert list(iter_reuters(path)) == read_reuters(path)
+
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_iter_label_directories(tmp_path, threads):
+    for label in ["C01", "C02", "C03"]:
+        os.mkdir(tmp_path / label)
+        for i in range(20):
+            (tmp_path / label / f"{i:04d}").write_text(f"\n  {label} text {i}\n second line \n\n")
+    # files at the top level and directories in a label directory are skipped
+    (tmp_path / "README").write_text("not a text")
+    os.mkdir(tmp_path / "C01" / "nested")
+    assert list(iter_label_directories(str(tmp_path), threads)) == read_label_directories(str(tmp_path))
+
+
+def test_chunked():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
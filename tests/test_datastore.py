@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from datastore import load_cached, read_dataset, write_dataset
+
+TRAIN = [("earn", "net profit rose"), ("acq", ""), (3, "é\nnon ascii"), ("earn", ""), (True, "bool label")]
+TEST = [("acq", "shares"), ("crude", "")]
+
+
+@pytest.mark.parametrize("train, test", [(TRAIN, TEST), (TRAIN, []), ([], TEST), ([], [])])
+def test_round_trip(tmp_path, train, test):
+    path = str(tmp_path / "dataset.ftds")
+    write_dataset(path, iter(train), iter(test))
+    stored_train, stored_test = read_dataset(path)
+    for pairs, stored in [(train, stored_train), (test, stored_test)]:
+        assert len(stored) == len(pairs)
+        assert list(stored) == pairs
+        assert [stored[i] for i in range(len(pairs))] == pairs
+        assert stored[:] == pairs
+        assert [bytes(d) for d in stored.data()] == [text.encode("UTF-8") for _, text in pairs]
+    # labels are coded once for both splits
+    assert stored_train.labels == stored_test.labels
+
+
+def test_numpy_labels(tmp_path):
+    path = str(tmp_path / "dataset.ftds")
+    write_dataset(path, [(np.int64(1), "a"), (np.int64(2), "b")], [])
+    assert list(read_dataset(path)[0]) == [(1, "a"), (2, "b")]
+
+
+def test_load_cached_loads_once(tmp_path):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return TRAIN, TEST
+
+    for _ in range(2):
+        train, test = load_cached("dataset", loader, str(tmp_path))
+        assert list(train) == TRAIN and list(test) == TEST
+    assert len(calls) == 1
+
+
+def test_invalid_file(tmp_path):
+    path = tmp_path / "dataset.ftds"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        read_dataset(str(path))
@@ -0,0 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+
+
+# the counters of the threads of a pool are kept when the pool exits, not the per-thread counters
+def test_exited_threads_are_folded():
+    recorder = instrumentation.Instrumentation()
+    for _ in range(10):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: recorder.add("x", 1, bytes_in=2), range(8)))
+    assert recorder.snapshot() == [{"name": "x", "labels": {}, "calls": 80, "ns": 80, "bytes_in": 160, "bytes_out": 0}]
+    assert len(recorder._thread_counters) == 0
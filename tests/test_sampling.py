@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from sampling import ByteReservoir, sample
+
+# distinct items of 4 to 200 bytes
+ITEMS = [(b"%03d:" % i) * random.Random(i).randint(1, 50) for i in range(500)]
+
+
+def test_same_seed_same_sample():
+    assert sample(ITEMS, 2000, seed=3) == sample(ITEMS, 2000, seed=3)
+    assert sample(ITEMS, 2000, seed=3) != sample(ITEMS, 2000, seed=4)
+
+
+@pytest.mark.parametrize("budget", [1, 100, 2000, 100000])
+def test_sample_fits_in_budget(budget):
+    reservoir = ByteReservoir(budget, seed=0)
+    for item in ITEMS:
+        reservoir.add(item)
+        assert reservoir.size == sum(len(i) for i in reservoir.items())
+        assert reservoir.size <= budget or len(reservoir.items()) == 1
+
+
+def test_sample_keeps_items_in_order():
+    sampled = sample(ITEMS, 2000)
+    positions = [ITEMS.index(item) for item in sampled]
+    assert positions == sorted(positions)
+    assert sample(ITEMS, sum(len(i) for i in ITEMS)) == ITEMS
+
+
+def test_sample_keeps_an_item_bigger_than_the_budget():
+    assert sample([b"x" * 10], 5) == [b"x" * 10]
+
+
+def test_invalid_budget():
+    with pytest.raises(ValueError):
+        ByteReservoir(0)
@@ -0,0 +1,50 @@
+from functools import partial
+
+import pytest
+
+from bench.synthetic import generate
+from compressorclassifier import CompressorClassifier
+from compressors.zstd_compressor import ZstdCompressor
+from shardedclassifier import ShardedCompressorClassifier
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return generate(num_classes=6, docs_per_class=20, words_per_doc=20, shared_vocabulary_size=200,
+                    class_vocabulary_size=50)
+
+
+# top_k 2 merges the best classes of the shards, the cascade scores the best classes of the prefix on their shards
+@pytest.mark.parametrize("params", [{}, {"top_k": 2}, {"cascade_prefix": 40, "cascade_keep": 0.5},
+                                    {"aggregation": "min"}])
+@pytest.mark.parametrize("num_shards", [1, 3])
+def test_sharded_predictions_match(dataset, params, num_shards):
+    train_pair, test_pair = dataset
+    classifier = CompressorClassifier(partial(ZstdCompressor, size=-1), num_compressors_per_class=2, **params)
+    classifier.fit(train_pair)
+    texts = [text for _, text in test_pair]
+    with ShardedCompressorClassifier.from_classifier(classifier, num_shards, batch_size=7) as sharded:
+        assert sharded.labels() == classifier.labels()
+        assert sharded.predict_batch(texts) == classifier.predict_batch(texts)
+
+
+@pytest.mark.parametrize("num_shards", [1, 4])
+def test_load_per_shard(dataset, tmp_path, num_shards):
+    train_pair, test_pair = dataset
+    classifier = CompressorClassifier(partial(ZstdCompressor, size=-1), num_compressors_per_class=2)
+    classifier.fit(train_pair)
+    path = str(tmp_path / "model.bin")
+    classifier.save(path)
+    # a shard only loads its classes, in the order of the model file
+    labels = classifier.labels()
+    shard = CompressorClassifier.load(path, labels=[labels[3], labels[1]])
+    assert shard.labels() == [labels[1], labels[3]]
+    texts = [text for _, text in test_pair]
+    with ShardedCompressorClassifier.load(path, num_shards) as sharded:
+        assert sharded.labels() == classifier.labels()
+        assert sharded.predict_batch(texts) == classifier.predict_batch(texts)
+
+
+def test_cross_class_aggregation_rejected():
+    with pytest.raises(ValueError):
+        ShardedCompressorClassifier([], [], aggregation="vote")